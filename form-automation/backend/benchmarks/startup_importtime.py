@@ -0,0 +1,71 @@
+# startup_importtime.py
+"""
+Measure how long a fresh interpreter takes to import the backend, the way a new
+gunicorn worker does, using `python -X importtime`.
+
+Usage (from form-automation/backend):
+    python benchmarks/startup_importtime.py [--module app] [--repeat 5] [--top 15]
+
+Prints the median total import time over the runs and the modules with the largest
+cumulative import time in the median run.
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module):
+    """
+    Import a module in a fresh interpreter.
+
+    Args:
+        module (str): Module to import
+
+    Returns:
+        list: (cumulative_us, self_us, name) for every imported module, in import order
+    """
+    env = dict(os.environ)
+    # Keep background threads out of the measurement
+    env['JANITOR_ENABLED'] = 'false'
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend startup import time")
+    parser.add_argument('--module', default='app', help="module to import (default: app)")
+    parser.add_argument('--repeat', type=int, default=5, help="number of fresh interpreters")
+    parser.add_argument('--top', type=int, default=15, help="slowest modules to list")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    # The module itself is the last, outermost entry of each run
+    totals = [next(row[0] for row in reversed(run) if row[2].strip() == args.module) for run in runs]
+    median_total = statistics.median(totals)
+    median_run = runs[totals.index(sorted(totals)[len(totals) // 2])]
+
+    print(f"import {args.module}: median {median_total / 1000:.1f} ms "
+          f"(min {min(totals) / 1000:.1f} ms, max {max(totals) / 1000:.1f} ms, {args.repeat} runs)")
+    print("\nSlowest modules by cumulative time:")
+    for cumulative_us, self_us, name in sorted(median_run, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {self_us / 1000:7.1f} ms self  {name.strip()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# clients.py
+import os
+import logging
+import threading
+
+# The SDKs (and httpx) are imported when the first client is created: together they
+# take over a second to import, which every worker would otherwise pay at startup.
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Connection pool and timeouts shared by every Mistral and OpenAI call
+HTTP_POOL_SIZE = int(os.environ.get('LLM_HTTP_POOL_SIZE', 20))
+HTTP_KEEPALIVE_CONNECTIONS = int(os.environ.get('LLM_HTTP_KEEPALIVE', 10))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('LLM_HTTP_CONNECT_TIMEOUT', 10))
+HTTP_TIMEOUT = float(os.environ.get('LLM_HTTP_TIMEOUT', 120))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _http_limits():
+    import httpx
+    return httpx.Limits(max_connections=HTTP_POOL_SIZE,
+                        max_keepalive_connections=HTTP_KEEPALIVE_CONNECTIONS)
+
+
+def _http_timeout():
+    import httpx
+    return httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+def _get_client(kind, api_key, factory):
+    """Return the cached client of a kind for an API key, creating it on first use"""
+    key = (kind, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = factory(api_key)
+            _clients[key] = client
+            logger.info(f"Created pooled {kind} client (pool size {HTTP_POOL_SIZE}, timeout {HTTP_TIMEOUT}s)")
+        return client
+
+
+def get_mistral_client(api_key=None):
+    """
+    Return the process-wide Mistral client for an API key.
+
+    Clients keep their HTTP connections alive between calls, so repeated OCR and chat
+    requests reuse TCP connections and TLS sessions instead of reconnecting.
+
+    Args:
+        api_key (str, optional): Mistral API key (defaults to MISTRAL_API_KEY)
+
+    Returns:
+        Mistral: Shared client
+    """
+    api_key = api_key or os.environ.get("MISTRAL_API_KEY")
+
+    def factory(key):
+        import httpx
+        from mistralai import Mistral
+        http_client = httpx.Client(limits=_http_limits(), timeout=_http_timeout())
+        return Mistral(api_key=key, client=http_client, timeout_ms=int(HTTP_TIMEOUT * 1000))
+
+    return _get_client('mistral', api_key, factory)
+
+
+def get_openai_client(api_key=None):
+    """
+    Return the process-wide OpenAI client for an API key.
+
+    Args:
+        api_key (str, optional): OpenAI API key (defaults to OPENAI_API_KEY)
+
+    Returns:
+        OpenAI: Shared client
+    """
+    api_key = api_key or os.environ.get("OPENAI_API_KEY")
+
+    def factory(key):
+        from openai import OpenAI, DefaultHttpxClient
+        http_client = DefaultHttpxClient(limits=_http_limits(), timeout=_http_timeout())
+        return OpenAI(api_key=key, http_client=http_client, timeout=_http_timeout())
+
+    return _get_client('openai', api_key, factory)
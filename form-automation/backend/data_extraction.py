@@ -1,12 +1,154 @@
 # data_extraction.py
 import re
-from mistralai import Mistral
 import os
 import json
+import logging
+
+from clients import get_mistral_client
+from metrics import stage_timer, record_token_usage
+from text_chunking import extract_in_chunks
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rule-based patterns, compiled once, in priority order per field
+NAME_PATTERNS = [
+    re.compile(r"(?:Patient|Client|Child)'?s?\s+Name:?\s+([A-Za-z\s.-]+)"),
+    re.compile(r"Name:?\s+([A-Za-z\s.-]+)"),
+    re.compile(r"(?:Patient|Client|Child):?\s+([A-Za-z\s.-]+)")
+]
+
+AGE_PATTERNS = [
+    re.compile(r"Age:?\s+(\d+)\s*(?:years|yrs|y\.o\.)?"),
+    re.compile(r"(\d+)\s*(?:years|yrs|year|yr)(?:\s+old)?")
+]
+
+# Match common date formats (MM/DD/YYYY, MM-DD-YYYY, YYYY-MM-DD, etc.), also after
+# "Date of Birth (DOB):" as EHR exports write it
+DOB_PATTERNS = [
+    re.compile(r"(?:DOB|Date\s+of\s+Birth)(?:\s*\(DOB\))?:?\s+"
+               r"(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}[/-]\d{1,2}[/-]\d{2,4})"),
+    re.compile(r"(?:DOB|Date\s+of\s+Birth)(?:\s*\(DOB\))?:?\s+(\w+\s+\d{1,2},?\s+\d{2,4})")
+]
+
+# Diagnosis patterns including ICD-10 codes. The last one only starts where a run of
+# letters and spaces starts: any match found inside a run is also found at its start,
+# and without the lookbehind every position of a long prose run is retried.
+DIAGNOSIS_PATTERNS = [
+    re.compile(r"(?:Diagnosis|Dx):?\s+([A-Za-z\s]+)\s+\(?(F\d+\.\d+)\)?"),
+    re.compile(r"(F\d+\.\d+)\s+([A-Za-z\s]+)"),
+    re.compile(r"(?<![A-Za-z\s])([A-Za-z\s]+)\s+(?:Disorder|Syndrome)\s+\(?(F\d+\.\d+)\)?")
+]
+
+GUARDIAN_PATTERNS = [
+    re.compile(r"(?:Parent|Guardian):?\s+([A-Za-z\s.-]+)"),
+    re.compile(r"(?:Parent|Guardian)'?s?\s+Name:?\s+([A-Za-z\s.-]+)")
+]
+
+GENDER_PATTERNS = [
+    re.compile(r"(?:Gender|Sex):?\s+((?i:male|female|non-?binary|m|f))\b")
+]
+
+# Relationship of the guardian, labelled or in parentheses after the guardian's name
+_RELATIONSHIPS = (r"(?i:step-?mother|step-?father|grandmother|grandfather|foster\s+parent|"
+                  r"legal\s+guardian|mother|father|aunt|uncle|sister|brother|guardian|parent)")
+RELATIONSHIP_PATTERNS = [
+    re.compile(r"Relationship(?:\s+to\s+(?:Patient|Client|Child))?:?\s+(" + _RELATIONSHIPS + r")\b")
+]
+_GUARDIAN_RELATIONSHIP_SUFFIX = re.compile(r"[ \t]*\(\s*(" + _RELATIONSHIPS + r")\s*\)")
+
+# Confidence of a value found by each pattern above, in the same order. Labelled
+# fields ("Patient Name:", "DOB:") are trusted; bare numbers and generic labels are not.
+RULE_CONFIDENCE = {
+    'name': [0.95, 0.6, 0.8],
+    'age': [0.9, 0.4],
+    'dob': [0.95, 0.85],
+    'diagnoses': [0.9, 0.9, 0.85],
+    'guardian': [0.85, 0.95],
+    'gender': [0.95],
+    'guardian_relationship': [0.9]
+}
+# Confidence of a relationship given in parentheses after the guardian's name
+GUARDIAN_SUFFIX_CONFIDENCE = 0.85
+# Confidence of a bare "Name:" under a "Patient Information" heading, where it can only
+# be the patient's
+PATIENT_SECTION_NAME_CONFIDENCE = 0.9
+
+# Numbered or markdown headings ("1. Patient Information", "## Patient Information")
+_SECTION_HEADING = re.compile(r"^[ \t]*(?:#{1,6}[ \t]+|\d{1,2}\.[ \t]+)(.+?)[ \t]*$", re.MULTILINE)
+_PATIENT_SECTION = re.compile(
+    r"(?:\d{1,2}\.[ \t]*)?(?:Patient|Client|Child)(?:'s)?\s+(?:Information|Info|Demographics|Details)\b",
+    re.IGNORECASE)
+
+# Labels of one-line EHR headers ("Patient Name: Amy Smith DOB: 01/02/2016"). Names are
+# captured as runs of letters, so a capture can run on into the next label; a name
+# ending in one of these is cut back or not trusted.
+FIELD_LABELS = (
+    "date of birth", "birth date", "dob", "age", "gender", "sex", "phone number", "phone", "telephone",
+    "tel", "cell", "email", "address", "city", "state", "zip", "mrn", "ssn", "id", "member id", "ma id",
+    "medicaid", "insurance", "relationship", "name", "patient", "client", "child", "parent", "guardian",
+    "mother", "father", "diagnosis", "dx", "school", "grade", "language", "race", "ethnicity", "date",
+    "provider", "physician", "referral"
+)
+_FIELD_LABEL_SETS = {}
+for _label in FIELD_LABELS:
+    _FIELD_LABEL_SETS.setdefault(len(_label.split()), set()).add(_label)
+_LABEL_COLON = re.compile(r"[ \t]*:")
+
+# Rule-based values scoring below this are treated as missing by the hybrid extraction
+RULE_CONFIDENCE_THRESHOLD = float(os.environ.get('RULE_CONFIDENCE_THRESHOLD', 0.75))
+
+# What the enhancement prompt asks for when a rule-based field is missing
+LLM_FIELD_DESCRIPTIONS = {
+    'name': "Full name of the patient",
+    'age': "Age of the patient in years",
+    'dob': "Date of birth in format MM/DD/YYYY",
+    'guardian': "Full name of the parent or guardian",
+    'gender': "Patient's gender",
+    'guardian_relationship': "Relationship of the guardian to the patient",
+    'diagnoses': 'Diagnoses, as a list of objects with "name" and "code" (ICD-10 code if present)'
+}
+
+_NUMERIC_DATE = re.compile(r"(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})$")
+_ISO_DATE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})$")
+
+# Every rule-based pattern starts at one of these anchors, so a single pass over the
+# anchors finds every position where any of them can match. Anchors are short and
+# never overlap, so no candidate position is skipped. The leading lookahead lets the
+# regex engine jump straight to possible first characters.
+_ANCHOR_PATTERN = re.compile(
+    r"(?=[PCNADFSGR\d])(?:"
+    r"(?P<patient>Patient|Client|Child)|(?P<name>Name)|(?P<age>Age)|(?P<dob>DOB|Date)"
+    r"|(?P<diagnosis>Diagnosis|Dx)|(?P<code>F(?=\d))|(?P<disorder>Disorder|Syndrome)"
+    r"|(?P<guardian>Parent|Guardian)|(?P<gender>Gender|Sex)|(?P<relationship>Relationship)"
+    r"|(?P<number>\d+))"
+)
+_RUN_CHAR = re.compile(r"[A-Za-z\s]")
+
+# Anchor -> (field, pattern index) candidates tried at the anchor position
+_ANCHOR_CANDIDATES = {
+    'patient': [('name', 0), ('name', 2)],
+    'name': [('name', 1)],
+    'age': [('age', 0)],
+    'number': [('age', 1)],
+    'dob': [('dob', 0), ('dob', 1)],
+    'diagnosis': [('diagnoses', 0)],
+    'code': [('diagnoses', 1)],
+    'guardian': [('guardian', 0), ('guardian', 1)],
+    'gender': [('gender', 0)],
+    'relationship': [('guardian_relationship', 0)]
+}
+
+_FIELD_PATTERNS = {
+    'name': NAME_PATTERNS,
+    'age': AGE_PATTERNS,
+    'dob': DOB_PATTERNS,
+    'diagnoses': DIAGNOSIS_PATTERNS,
+    'guardian': GUARDIAN_PATTERNS,
+    'gender': GENDER_PATTERNS,
+    'guardian_relationship': RELATIONSHIP_PATTERNS
+}
 
-# Initialize Mistral client for NLP tasks
-api_key = os.environ.get("MISTRAL_API_KEY")
-mistral_client = Mistral(api_key=api_key)
 
 def extract_patient_data(text):
     """
@@ -20,139 +162,332 @@ def extract_patient_data(text):
         dict: Structured patient data
     """
     # First attempt rule-based extraction for common patterns
+    fields = score_rule_based_fields(text)
     patient_data = {
-        "name": extract_name(text),
-        "age": extract_age(text),
-        "dob": extract_dob(text),
-        "diagnoses": extract_diagnoses(text),
-        "guardian": extract_guardian_info(text),
+        "name": fields["name"]["value"],
+        "age": fields["age"]["value"],
+        "dob": fields["dob"]["value"],
+        "diagnoses": fields["diagnoses"]["value"],
+        "guardian": {"name": fields["guardian"]["value"]},
         "symptoms": [],
         "goals": [],
         "treatment_history": None
     }
     
-    # Use LLM to extract more complex information
-    patient_data = enhance_with_llm(text, patient_data)
+    # Use LLM to extract more complex information, plus whatever the rules missed
+    missing_fields = low_confidence_fields(fields, ['name', 'age', 'dob', 'guardian', 'diagnoses'])
+    patient_data = enhance_with_llm(text, patient_data, missing_fields)
     
     return patient_data
 
-def extract_name(text):
-    """Extract patient name using regex patterns"""
-    # Try common formats
-    patterns = [
-        r"(?:Patient|Client|Child)'?s?\s+Name:?\s+([A-Za-z\s.-]+)",
-        r"Name:?\s+([A-Za-z\s.-]+)",
-        r"(?:Patient|Client|Child):?\s+([A-Za-z\s.-]+)"
-    ]
+def _scan_rule_based_matches(text):
+    """
+    Run all rule-based patterns in a single pass over the text.
     
-    for pattern in patterns:
-        match = re.search(pattern, text)
-        if match:
-            return match.group(1).strip()
+    Single-valued fields take the first match of each pattern (the highest-priority
+    match wins), diagnoses collect the non-overlapping matches of each pattern.
     
-    return None
+    Returns:
+        tuple: (first match of each pattern per single-valued field, all matches of
+               each diagnosis pattern), both in pattern order
+    """
+    first_matches = {field: [None] * len(patterns) for field, patterns in _FIELD_PATTERNS.items()
+                     if field != 'diagnoses'}
+    diagnosis_matches = [[] for _ in DIAGNOSIS_PATTERNS]
+    # Per diagnosis pattern: where its next match may start, and run starts already tried
+    diagnosis_next = [0] * len(DIAGNOSIS_PATTERNS)
+    tried_runs = set()
+    
+    for anchor in _ANCHOR_PATTERN.finditer(text):
+        position = anchor.start()
+        
+        if anchor.lastgroup == 'disorder':
+            # The name in front of "Disorder" starts where the run of letters and spaces starts
+            run_start = position
+            while run_start > 0 and _RUN_CHAR.match(text, run_start - 1):
+                run_start -= 1
+            if run_start in tried_runs:
+                continue
+            tried_runs.add(run_start)
+            candidates = [('diagnoses', 2, run_start)]
+        else:
+            candidates = [(field, index, position) for field, index in _ANCHOR_CANDIDATES[anchor.lastgroup]]
+        
+        for field, index, start in candidates:
+            pattern = _FIELD_PATTERNS[field][index]
+            if field == 'diagnoses':
+                if start < diagnosis_next[index]:
+                    continue
+                match = pattern.match(text, start)
+                if match:
+                    diagnosis_matches[index].append(match)
+                    diagnosis_next[index] = match.end()
+            elif first_matches[field][index] is None:
+                first_matches[field][index] = pattern.match(text, start)
+    
+    return first_matches, diagnosis_matches
 
-def extract_age(text):
-    """Extract patient age"""
-    patterns = [
-        r"Age:?\s+(\d+)\s*(?:years|yrs|y\.o\.)?",
-        r"(\d+)\s*(?:years|yrs|year|yr)(?:\s+old)?"
-    ]
+def score_rule_based_fields(text):
+    """
+    Run the rule-based extractors and rate how far each value can be trusted.
     
-    for pattern in patterns:
-        match = re.search(pattern, text)
-        if match:
-            return match.group(1).strip()
+    Each value gets the confidence of the pattern that found it (RULE_CONFIDENCE),
+    lowered when it does not look like what the field holds: names are cut at the end
+    of their line and before a following "Label:", and must be two to four capitalised
+    words not ending in a field label; numeric dates must be valid calendar dates.
+    A bare "Name:" under a "Patient Information" heading is trusted like "Patient Name:",
+    and ISO dates are written as MM/DD/YYYY like the LLM's.
     
-    return None
+    Args:
+        text (str): The OCR-extracted text
+        
+    Returns:
+        dict: name, age, dob, guardian, gender, guardian_relationship and diagnoses,
+              each {"value": ..., "confidence": float}; missing values have confidence 0
+    """
+    first_matches, diagnosis_matches = _scan_rule_based_matches(text)
+    
+    def scored(field, check=None, clean=None):
+        for index, match in enumerate(first_matches[field]):
+            if match:
+                value = clean(match) if clean else match.group(1).strip()
+                confidence = _rule_confidence(field, index, match, text)
+                if check and not check(value):
+                    confidence /= 2
+                return {"value": value or None, "confidence": confidence if value else 0.0}
+        return {"value": None, "confidence": 0.0}
+    
+    def clean_name(match):
+        return _trim_trailing_label(match, text)
+    
+    guardian = scored('guardian', _looks_like_name, clean_name)
+    relationship = scored('guardian_relationship', clean=lambda match: match.group(1).strip().title())
+    if relationship["confidence"] < GUARDIAN_SUFFIX_CONFIDENCE:
+        # "Guardian: Jane Smith (Mother)"
+        for match in first_matches['guardian']:
+            suffix = match and _GUARDIAN_RELATIONSHIP_SUFFIX.match(text, match.end())
+            if suffix:
+                relationship = {"value": suffix.group(1).title(), "confidence": GUARDIAN_SUFFIX_CONFIDENCE}
+                break
+    
+    diagnoses = []
+    confidence = 0.0
+    for index, matches in enumerate(diagnosis_matches):
+        for match in matches:
+            diagnoses.append(_diagnosis_from_match(match))
+            confidence = max(confidence, RULE_CONFIDENCE['diagnoses'][index])
+    
+    return {
+        "name": scored('name', _looks_like_name, clean_name),
+        "age": scored('age'),
+        "dob": scored('dob', _looks_like_date, lambda match: _us_date(match.group(1).strip())),
+        "guardian": guardian,
+        "gender": scored('gender', clean=lambda match: _normalize_gender(match.group(1))),
+        "guardian_relationship": relationship,
+        "diagnoses": {"value": diagnoses, "confidence": confidence}
+    }
 
-def extract_dob(text):
-    """Extract date of birth"""
-    # Match common date formats (MM/DD/YYYY, MM-DD-YYYY, etc.)
-    patterns = [
-        r"(?:DOB|Date\s+of\s+Birth):?\s+(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})",
-        r"(?:DOB|Date\s+of\s+Birth):?\s+(\w+\s+\d{1,2},?\s+\d{2,4})"
-    ]
+def low_confidence_fields(scored_fields, fields=None, threshold=RULE_CONFIDENCE_THRESHOLD):
+    """
+    List the fields the rule-based pass could not fill with enough confidence.
     
+    Args:
+        scored_fields (dict): Result of score_rule_based_fields
+        fields (list, optional): Fields to check (defaults to all)
+        threshold (float): Minimum confidence of a trusted value
+        
+    Returns:
+        list: Field names, in the order given
+    """
+    return [field for field in (fields or scored_fields)
+            if scored_fields[field]["confidence"] < threshold]
+
+def _trim_trailing_label(match, text):
+    """
+    Name captured by a match, cut at the end of its line and before the next label.
+    
+    In "Patient Name: Amy Smith DOB: 01/02/2016" the capture is "Amy Smith DOB"; when a
+    colon follows the capture, the next field's label is at its end and is dropped from
+    the first word that starts a known label (FIELD_LABELS), otherwise the last word.
+    """
+    value = match.group(1).strip()
+    if "\n" in value:
+        return value.split("\n")[0].strip()
+    
+    if _LABEL_COLON.match(text, match.end()):
+        words = value.split()
+        for index in range(1, len(words)):
+            if any(" ".join(words[index:index + size]).lower() in labels
+                   for size, labels in _FIELD_LABEL_SETS.items()):
+                return " ".join(words[:index])
+        return " ".join(words[:-1])
+    return value
+
+def _rule_confidence(field, index, match, text):
+    """Confidence of a value found by the given pattern (RULE_CONFIDENCE), in context"""
+    # NAME_PATTERNS[1] is the bare "Name:"
+    if field == 'name' and index == 1 and _in_patient_section(text, match.start()):
+        return PATIENT_SECTION_NAME_CONFIDENCE
+    return RULE_CONFIDENCE[field][index]
+
+def _in_patient_section(text, position):
+    """Whether the last heading before position is a "Patient Information" heading"""
+    heading = None
+    for heading in _SECTION_HEADING.finditer(text, 0, position):
+        pass
+    return bool(heading and _PATIENT_SECTION.match(heading.group(1)))
+
+def _ends_with_label(words):
+    """Whether the last words of a value form one of FIELD_LABELS"""
+    return any(len(words) >= size and " ".join(words[-size:]).lower() in labels
+               for size, labels in _FIELD_LABEL_SETS.items())
+
+def _looks_like_name(value):
+    """
+    Two to four capitalised words not ending in a field label, e.g. not the start of a
+    sentence caught after "Patient:" or "Jane Smith Phone" from "Parent: Jane Smith Phone 555"
+    """
+    words = value.replace(".", " ").split()
+    return (2 <= len(words) <= 4 and all(word[0].isupper() for word in words)
+            and not _ends_with_label(words))
+
+def _normalize_gender(value):
+    """Spell out single-letter genders"""
+    value = value.strip()
+    return {"m": "Male", "f": "Female"}.get(value.lower(), value.title())
+
+def _us_date(value):
+    """Write YYYY-MM-DD dates as MM/DD/YYYY; other dates are kept as they are"""
+    match = _ISO_DATE.match(value)
+    if not match:
+        return value
+    year, month, day = match.groups()
+    return f"{month.zfill(2)}/{day.zfill(2)}/{year}"
+
+def _looks_like_date(value):
+    """Numeric dates must name a real month and day; written-out dates pass as they are"""
+    match = _NUMERIC_DATE.match(value)
+    if not match:
+        return True
+    month, day = int(match.group(1)), int(match.group(2))
+    return 1 <= month <= 12 and 1 <= day <= 31
+
+def _first_match_value(patterns, text):
+    """Return the stripped first group of the first pattern that matches"""
     for pattern in patterns:
-        match = re.search(pattern, text)
+        match = pattern.search(text)
         if match:
             return match.group(1).strip()
     
     return None
 
+def _diagnosis_from_match(match):
+    """Build a diagnosis entry from a match holding a name and an ICD code in either order"""
+    if match.group(1).startswith('F'):
+        code, name = match.group(1), match.group(2)
+    else:
+        name, code = match.group(1), match.group(2)
+    
+    return {
+        "name": name.strip(),
+        "code": code.strip()
+    }
+
+def extract_name(text):
+    """Extract patient name using regex patterns"""
+    return _first_match_value(NAME_PATTERNS, text)
+
+def extract_age(text):
+    """Extract patient age"""
+    return _first_match_value(AGE_PATTERNS, text)
+
+def extract_dob(text):
+    """Extract date of birth"""
+    return _first_match_value(DOB_PATTERNS, text)
+
 def extract_diagnoses(text):
     """Extract diagnoses including ICD codes"""
-    diagnoses = []
-    
-    # Look for diagnosis patterns including ICD-10 codes
-    patterns = [
-        r"(?:Diagnosis|Dx):?\s+([A-Za-z\s]+)\s+\(?(F\d+\.\d+)\)?",
-        r"(F\d+\.\d+)\s+([A-Za-z\s]+)",
-        r"([A-Za-z\s]+)\s+(?:Disorder|Syndrome)\s+\(?(F\d+\.\d+)\)?"
-    ]
-    
-    for pattern in patterns:
-        for match in re.finditer(pattern, text):
-            if len(match.groups()) == 2:
-                # If we have both diagnosis name and code
-                if match.group(1).startswith('F'):
-                    code, name = match.group(1), match.group(2)
-                else:
-                    name, code = match.group(1), match.group(2)
-                
-                diagnoses.append({
-                    "name": name.strip(),
-                    "code": code.strip()
-                })
-    
-    return diagnoses
+    return [_diagnosis_from_match(match)
+            for pattern in DIAGNOSIS_PATTERNS
+            for match in pattern.finditer(text)]
 
 def extract_guardian_info(text):
     """Extract guardian information"""
-    patterns = [
-        r"(?:Parent|Guardian):?\s+([A-Za-z\s.-]+)",
-        r"(?:Parent|Guardian)'?s?\s+Name:?\s+([A-Za-z\s.-]+)"
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text)
-        if match:
-            return {"name": match.group(1).strip()}
-    
-    return {"name": None}
+    return {"name": _first_match_value(GUARDIAN_PATTERNS, text)}
 
-def enhance_with_llm(text, partial_data):
+def enhance_with_llm(text, partial_data, missing_fields=()):
     """
-    Use Mistral LLM to extract additional information and enhance extraction
+    Use Mistral LLM to extract additional information and enhance extraction.
+    Long documents are sent in token-bounded chunks concurrently and the answers merged.
     
     Args:
         text (str): OCR text
         partial_data (dict): Partially extracted data from rule-based methods
+        missing_fields (iterable): Rule-based fields (see LLM_FIELD_DESCRIPTIONS) that are
+                                   missing or low-confidence; only these are asked for
         
     Returns:
         dict: Enhanced patient data
     """
+    missing_fields = [field for field in missing_fields if field in LLM_FIELD_DESCRIPTIONS]
+    logger.info(f"Calling LLM for missing fields: {missing_fields}")
+    llm_extracted = extract_in_chunks(text, lambda chunk: _enhance_chunk_with_llm(chunk, missing_fields))
+    
+    # Fill the fields the rules could not, keeping the rule-based value if the LLM has none
+    for field in missing_fields:
+        if llm_extracted.get(field):
+            partial_data[field] = {"name": llm_extracted[field]} if field == "guardian" else llm_extracted[field]
+    
+    # Update partial data with LLM extracted fields
+    if llm_extracted.get("symptoms"):
+        partial_data["symptoms"] = llm_extracted["symptoms"]
+    
+    if llm_extracted.get("goals"):
+        partial_data["goals"] = llm_extracted["goals"]
+    
+    if llm_extracted.get("treatment_history"):
+        partial_data["treatment_history"] = llm_extracted["treatment_history"]
+    
+    return partial_data
+
+def _enhance_chunk_with_llm(text, missing_fields=()):
+    """
+    Ask the LLM for symptoms, goals and treatment history in one chunk of the document.
+    
+    Args:
+        text (str): Chunk of the OCR text
+        missing_fields (list): Rule-based fields to ask for as well
+        
+    Returns:
+        dict: Fields found in the chunk; "None" answers are left out so they cannot
+              outvote real values from other chunks when the answers are merged
+    """
     # Prepare a prompt for the LLM
+    requested = [("symptoms", "Symptoms or behavioral issues described"),
+                 ("goals", "Treatment goals"),
+                 ("treatment_history", "Treatment history (if mentioned)")]
+    requested += [(field, LLM_FIELD_DESCRIPTIONS[field]) for field in missing_fields]
+    items = "\n".join(f"{number}. {description}" for number, (_, description) in enumerate(requested, 1))
+    keys = ", ".join(f'"{key}"' for key, _ in requested)
     prompt = f"""Extract the following information from this medical document about a patient:
-1. Symptoms or behavioral issues described
-2. Treatment goals
-3. Treatment history (if mentioned)
+{items}
 
 For any field where information is not available, respond with "None".
-Format the response as JSON with keys: "symptoms", "goals", "treatment_history".
+Format the response as JSON with keys: {keys}.
 
 Document text:
-{text[:4000]}  # Limiting text length to avoid token limits
+{text}
 """
 
-    # Call the LLM
-    response = mistral_client.chat.complete(
-        model="mistral-small-latest",  # Using a smaller model for efficiency
-        messages=[{"role": "user", "content": prompt}]
-    )
+    # Call the LLM (shared client, created on first use)
+    mistral_client = get_mistral_client(os.environ.get("MISTRAL_API_KEY"))
+    with stage_timer('llm_enhancement', model="mistral-small-latest"):
+        response = mistral_client.chat.complete(
+            model="mistral-small-latest",  # Using a smaller model for efficiency
+            messages=[{"role": "user", "content": prompt}]
+        )
+    record_token_usage('llm_enhancement', "mistral-small-latest", getattr(response, 'usage', None))
     
-    print(f"starting to use LLM to extract the data")
     # Parse the response
     try:
         # Try to extract JSON from the response
@@ -162,21 +497,13 @@ Document text:
         json_text = extract_json_from_text(content)
         if json_text:
             llm_extracted = json.loads(json_text)
-            
-            # Update partial data with LLM extracted fields
-            if llm_extracted.get("symptoms"):
-                partial_data["symptoms"] = llm_extracted["symptoms"]
-            
-            if llm_extracted.get("goals"):
-                partial_data["goals"] = llm_extracted["goals"]
-            
-            if llm_extracted.get("treatment_history"):
-                partial_data["treatment_history"] = llm_extracted["treatment_history"]
+            return {key: value for key, value in llm_extracted.items()
+                    if not (isinstance(value, str) and value.strip().lower() == "none")}
     
     except Exception as e:
-        print(f"Error parsing LLM response: {e}")
+        logger.error(f"Error parsing LLM response: {str(e)}")
     
-    return partial_data
+    return {}
 
 def extract_json_from_text(text):
     """Extract JSON object from text that may contain other content"""
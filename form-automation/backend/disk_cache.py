@@ -0,0 +1,207 @@
+# disk_cache.py
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Eviction frees space down to this share of max_bytes, so a full cache is not rescanned
+# on every following write
+CACHE_EVICT_LOW_WATER = 0.9
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """
+    Compute the SHA-256 hex digest of a file without reading it into memory at once.
+
+    Args:
+        file_path (str): Path to the file
+        chunk_size (int): Bytes read per iteration
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Persistent key/value cache storing JSON-serializable values as files on local disk.
+
+    Entries are evicted least-recently-used first once the total size of the cache
+    exceeds max_bytes, down to CACHE_EVICT_LOW_WATER of it. A cache hit touches the entry's access time, which is what the
+    eviction order is based on; the modification time stays the time the entry was
+    stored. With a ttl, entries older than ttl seconds (counted from when they were
+    stored) are treated as misses, and purge_expired deletes them from disk.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, ttl=None):
+        """
+        Args:
+            directory (str): Directory holding the cache entries
+            max_bytes (int): Size bound for all entries together
+            ttl (float, optional): Maximum entry age in seconds
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(stat.st_size for _, stat in self._scan())
+
+    def _path(self, key):
+        # Shard by the first two characters to keep directories small
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _scan(self):
+        """Yield (path, os.stat_result) for every entry in the cache"""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat
+
+    def get(self, key):
+        """
+        Look up a cached value.
+
+        Args:
+            key (str): Cache key (hex digest)
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {str(e)}")
+            self.delete(key)
+            return None
+
+        if not isinstance(entry, dict) or 'value' not in entry:
+            self.delete(key)
+            return None
+
+        if self.ttl is not None and time.time() - entry.get('createdAt', 0) > self.ttl:
+            self.delete(key)
+            return None
+
+        # Mark as recently used, keeping the mtime purge_expired goes by
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+        return entry['value']
+
+    def set(self, key, value):
+        """
+        Store a value, evicting old entries if the cache grows past its size bound.
+
+        Args:
+            key (str): Cache key (hex digest)
+            value: JSON-serializable value
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"createdAt": time.time(), "value": value}).encode("utf-8")
+
+        with self._lock:
+            try:
+                previous_size = os.path.getsize(path)
+            except OSError:
+                previous_size = 0
+
+            # Write atomically so concurrent readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+
+            self._total_bytes += len(data) - previous_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, key):
+        """Remove an entry if present"""
+        path = self._path(key)
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.unlink(path)
+                self._total_bytes -= size
+            except OSError:
+                pass
+
+    def purge_expired(self, now=None):
+        """
+        Delete the entries older than the ttl from disk.
+
+        Args:
+            now (float, optional): Current time (defaults to time.time())
+
+        Returns:
+            int: Number of entries deleted
+        """
+        if self.ttl is None:
+            return 0
+        now = time.time() if now is None else now
+        removed = 0
+
+        with self._lock:
+            for path, stat in list(self._scan()):
+                if now - stat.st_mtime <= self.ttl:
+                    continue
+                try:
+                    os.unlink(path)
+                    self._total_bytes -= stat.st_size
+                    removed += 1
+                except OSError:
+                    continue
+
+        if removed:
+            logger.info(f"Purged {removed} expired entries from cache at {self.directory}")
+        return removed
+
+    def _evict(self):
+        """Delete least-recently-used entries until the cache is back at its low-water mark"""
+        entries = sorted(self._scan(), key=lambda entry: entry[1].st_atime)
+        total = sum(stat.st_size for _, stat in entries)
+        target = self.max_bytes * CACHE_EVICT_LOW_WATER
+        evicted = 0
+
+        for path, stat in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= stat.st_size
+                evicted += 1
+            except OSError:
+                continue
+
+        self._total_bytes = total
+        if evicted:
+            logger.info(f"Evicted {evicted} entries from cache at {self.directory}")
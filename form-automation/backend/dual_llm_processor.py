@@ -3,8 +3,10 @@ import os
 import json
 import logging
 import traceback
-from mistralai import Mistral
-from openai import OpenAI
+from clients import get_mistral_client, get_openai_client
+from ocr_pipeline import ocr_document
+from llm_cache import cached_chat_completion
+from text_chunking import extract_in_chunks
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -27,69 +29,39 @@ class DocumentProcessor:
         if not self.mistral_api_key:
             raise ValueError("Mistral API key is required")
         
-        self.mistral_client = Mistral(api_key=self.mistral_api_key)
+        self.mistral_client = get_mistral_client(self.mistral_api_key)
         
         # Initialize OpenAI client
         self.openai_api_key = openai_api_key or os.environ.get("OPENAI_API_KEY")
         if not self.openai_api_key:
             raise ValueError("OpenAI API key is required")
         
-        self.openai_client = OpenAI(api_key=self.openai_api_key)
+        self.openai_client = get_openai_client(self.openai_api_key)
         
-        logger.info("DocumentProcessor initialized with both Mistral and OpenAI clients")
+        logger.info("DocumentProcessor initialized with shared Mistral and OpenAI clients")
     
-    def process_document_file(self, file_path):
+    def process_document_file(self, file_path, bypass_cache=False):
         """
         Process a document file through Mistral OCR and then analyze with ChatGPT.
         
         Args:
             file_path (str): Path to the document file
+            bypass_cache (bool): Ignore cached ChatGPT responses and refresh them
             
         Returns:
             tuple: (extracted_text, structured_data, form_mappings)
         """
         logger.info(f"Processing document file at: {file_path}")
         
-        # Step 1: Upload file to Mistral for OCR
         try:
-            with open(file_path, "rb") as f:
-                file_content = f.read()
-                logger.debug(f"Read {len(file_content)} bytes from file")
-            
-            # Get filename from path
-            filename = os.path.basename(file_path)
-            
-            uploaded_file = self.mistral_client.files.upload(
-                file={
-                    "file_name": filename,
-                    "content": open(file_path, "rb"),
-                },
-                purpose="ocr"
-            )
-            logger.info(f"File uploaded to Mistral with ID: {uploaded_file.id}")
-            
-            # Get signed URL for the uploaded file
-            signed_url = self.mistral_client.files.get_signed_url(file_id=uploaded_file.id)
-            logger.info("Signed URL obtained successfully")
-            
-            # Process OCR
-            ocr_response = self.mistral_client.ocr.process(
-                model="mistral-ocr-latest",
-                document={
-                    "type": "document_url",
-                    "document_url": signed_url.url,
-                }
-            )
-            logger.info("OCR processing completed with Mistral")
-            
-            # Extract text from OCR response
-            extracted_text = self._extract_text_from_ocr_response(ocr_response)
+            # Step 1: Get the document text (OCR cache, embedded text layer or Mistral OCR)
+            extracted_text = ocr_document(self.mistral_client, file_path, os.path.basename(file_path))
             
             # Step 2: Analyze extracted text with ChatGPT
-            structured_data = self._analyze_with_chatgpt(extracted_text)
+            structured_data = self._analyze_with_chatgpt(extracted_text, bypass_cache)
             
             # Step 3: Map to form templates
-            form_mappings = self._map_to_forms(structured_data)
+            form_mappings = self._map_to_forms(structured_data, bypass_cache)
             
             return extracted_text, structured_data, form_mappings
             
@@ -98,88 +70,22 @@ class DocumentProcessor:
             logger.error(traceback.format_exc())
             raise
     
-    def _extract_text_from_ocr_response(self, ocr_response):
-        """
-        Extract text content from Mistral OCR response.
-        
-        Args:
-            ocr_response: Mistral OCR response object
-            
-        Returns:
-            str: Extracted text
-        """
-        try:
-            # Try different methods to extract text from response
-            if hasattr(ocr_response, 'model_dump'):
-                response_dict = ocr_response.model_dump()
-                
-                # Try to find text content in response dictionary
-                if 'content' in response_dict:
-                    return response_dict['content']
-                    
-                elif 'data' in response_dict:
-                    return response_dict['data']
-                    
-                elif 'pages' in response_dict:
-                    # Some OCR APIs return text by pages
-                    pages_text = []
-                    for page in response_dict['pages']:
-                        if isinstance(page, dict) and 'text' in page:
-                            pages_text.append(page['text'])
-                    return '\n'.join(pages_text)
-            
-            # Try direct attribute access
-            if hasattr(ocr_response, 'content'):
-                return ocr_response.content
-                
-            elif hasattr(ocr_response, 'text'):
-                return ocr_response.text
-                
-            elif hasattr(ocr_response, 'data'):
-                return ocr_response.data
-            
-            # Last resort: convert whole response to string
-            return str(ocr_response)
-            
-        except Exception as e:
-            logger.error(f"Error extracting text from OCR response: {str(e)}")
-            logger.error(traceback.format_exc())
-            return str(ocr_response)
-    
-    def _analyze_with_chatgpt(self, text):
+    def _analyze_with_chatgpt(self, text, bypass_cache=False):
         """
         Use ChatGPT (OpenAI) to analyze and structure the extracted text.
+        Long documents are analyzed in chunks concurrently and the results merged.
         
         Args:
             text (str): Text extracted from document
+            bypass_cache (bool): Ignore cached responses
             
         Returns:
             dict: Structured patient data
         """
         logger.info(f"Analyzing extracted text with ChatGPT ({len(text)} chars)")
         
-        # Create a system prompt
-        system_prompt = """You are a specialized medical document analyzer. Extract structured information from medical documents
-with precision and accuracy. Focus on patient details, diagnoses, symptoms, and treatment information.
-Always return data in properly formatted JSON."""
-
-        # Create extraction prompt for the user
-        user_prompt = self._create_extraction_prompt(text)
-        
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",  # Using GPT-4o for best accuracy
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,  # Low temperature for consistent results
-                response_format={"type": "json_object"}  # Ensure JSON response
-            )
-            
-            # Extract and parse the JSON response
-            content = response.choices[0].message.content
-            structured_data = json.loads(content)
+            structured_data = extract_in_chunks(text, lambda chunk: self._analyze_chunk(chunk, bypass_cache))
             
             logger.info(f"Successfully extracted structured data with {len(structured_data)} fields using ChatGPT")
             return structured_data
@@ -197,12 +103,47 @@ Always return data in properly formatted JSON."""
                 "goals": []
             }
     
+    def _analyze_chunk(self, text, bypass_cache=False):
+        """
+        Run the ChatGPT extraction on one chunk of the document.
+        
+        Args:
+            text (str): Chunk of the extracted text
+            bypass_cache (bool): Ignore cached responses
+            
+        Returns:
+            dict: Structured data found in the chunk
+        """
+        # Create a system prompt
+        system_prompt = """You are a specialized medical document analyzer. Extract structured information from medical documents
+with precision and accuracy. Focus on patient details, diagnoses, symptoms, and treatment information.
+Always return data in properly formatted JSON."""
+
+        # Create extraction prompt for the user
+        user_prompt = self._create_extraction_prompt(text)
+        
+        content = cached_chat_completion(
+            self.openai_client,
+            model="gpt-4o",  # Using GPT-4o for best accuracy
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.1,  # Low temperature for consistent results
+            response_format={"type": "json_object"},  # Ensure JSON response
+            bypass_cache=bypass_cache,
+            stage="document_analysis"
+        )
+        
+        # Parse the JSON response
+        return json.loads(content)
+    
     def _create_extraction_prompt(self, text):
         """
         Create a detailed extraction prompt for ChatGPT.
         
         Args:
-            text (str): OCR text
+            text (str): OCR text (one chunk of it for long documents)
             
         Returns:
             str: Formatted prompt
@@ -250,21 +191,15 @@ Respond ONLY with valid JSON.
 
 Document text:
 """
-        # Limit text to avoid token limits while keeping as much as possible
-        max_chars = 15000
-        if len(text) > max_chars:
-            truncated_text = text[:max_chars]
-            logger.info(f"Truncating OCR text from {len(text)} to {len(truncated_text)} chars")
-            return prompt + truncated_text
-        else:
-            return prompt + text
+        return prompt + text
     
-    def _map_to_forms(self, extracted_data):
+    def _map_to_forms(self, extracted_data, bypass_cache=False):
         """
         Map the extracted data to form templates using ChatGPT.
         
         Args:
             extracted_data (dict): Extracted structured data
+            bypass_cache (bool): Ignore cached responses
             
         Returns:
             dict: Data mapped to form templates
@@ -308,18 +243,20 @@ Patient data:
 """
         
         try:
-            response = self.openai_client.chat.completions.create(
+            content = cached_chat_completion(
+                self.openai_client,
                 model="gpt-4o",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": mapping_prompt}
                 ],
                 temperature=0.1,
-                response_format={"type": "json_object"}
+                response_format={"type": "json_object"},
+                bypass_cache=bypass_cache,
+                stage="form_mapping"
             )
             
-            # Extract and parse the JSON response
-            content = response.choices[0].message.content
+            # Parse the JSON response
             mapped_data = json.loads(content)
             
             logger.info("Successfully mapped data to form templates")
@@ -376,7 +313,7 @@ Patient data:
 
 
 # Helper function for easy use in endpoints
-def process_document(file_path, mistral_api_key=None, openai_api_key=None):
+def process_document(file_path, mistral_api_key=None, openai_api_key=None, bypass_cache=False):
     """
     Process a document file and return extracted and structured data.
     
@@ -384,6 +321,7 @@ def process_document(file_path, mistral_api_key=None, openai_api_key=None):
         file_path (str): Path to the document file
         mistral_api_key (str, optional): Mistral API key
         openai_api_key (str, optional): OpenAI API key
+        bypass_cache (bool): Ignore cached ChatGPT responses and refresh them
         
     Returns:
         tuple: (extracted_text, structured_data, form_mappings)
@@ -394,7 +332,7 @@ def process_document(file_path, mistral_api_key=None, openai_api_key=None):
             openai_api_key=openai_api_key
         )
         
-        return processor.process_document_file(file_path)
+        return processor.process_document_file(file_path, bypass_cache=bypass_cache)
         
     except Exception as e:
         logger.error(f"Error in document processing: {str(e)}")
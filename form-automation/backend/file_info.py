@@ -0,0 +1,216 @@
+# file_info.py
+import os
+import re
+import mmap
+import logging
+import threading
+from collections import OrderedDict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Number of sniffed files remembered by content hash
+FILE_INFO_CACHE_SIZE = int(os.environ.get('FILE_INFO_CACHE_SIZE', 1024))
+
+# File kinds recognised from their leading bytes
+KIND_PDF = 'pdf'
+KIND_PNG = 'png'
+KIND_JPEG = 'jpeg'
+KIND_TIFF = 'tiff'
+
+_MAGIC_NUMBERS = (
+    (b'\x89PNG\r\n\x1a\n', KIND_PNG),
+    (b'\xff\xd8\xff', KIND_JPEG),
+    (b'II*\x00', KIND_TIFF),
+    (b'MM\x00*', KIND_TIFF),
+)
+
+# PDF readers accept the header anywhere in the first kilobyte
+_PDF_HEADER_WINDOW = 1024
+# startxref sits at the very end of the file, followed only by %%EOF
+_PDF_TAIL_WINDOW = 2048
+
+_STARTXREF_RE = re.compile(rb'startxref\s+(\d+)')
+_XREF_SUBSECTION_RE = re.compile(rb'\s*(\d+)\s+(\d+)[ \t]*[\r\n]+')
+_XREF_ENTRY_RE = re.compile(rb'\s*(\d{10})\s(\d{5})\s([nf])')
+_OBJECT_HEADER_RE = re.compile(rb'\s*(\d+)\s+\d+\s+obj')
+_TRAILER_ROOT_RE = re.compile(rb'/Root\s+(\d+)\s+\d+\s+R')
+_TRAILER_PREV_RE = re.compile(rb'/Prev\s+(\d+)')
+_CATALOG_PAGES_RE = re.compile(rb'/Pages\s+(\d+)\s+\d+\s+R')
+_PAGES_COUNT_RE = re.compile(rb'/Count\s+(\d+)')
+
+_file_info_cache = OrderedDict()
+_file_info_cache_lock = threading.Lock()
+
+
+def _sniff_kind(head):
+    """Return the file kind identified by the leading bytes, or None"""
+    if b'%PDF-' in head[:_PDF_HEADER_WINDOW]:
+        return KIND_PDF
+    for magic, kind in _MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def _read_object(data, offsets, number):
+    """
+    Return the bytes of an indirect object (up to its endobj), or None if the
+    cross-reference table does not point at that object.
+    """
+    offset = offsets.get(number)
+    if offset is None:
+        return None
+    header = _OBJECT_HEADER_RE.match(data, offset)
+    if not header or int(header.group(1)) != number:
+        return None
+    end = data.find(b'endobj', offset)
+    return data[offset:end if end != -1 else offset + 4096]
+
+
+def _xref_offsets(data, xref_offset):
+    """
+    Read a classic cross-reference table and the trailers chained through /Prev.
+
+    Args:
+        data (mmap): File contents
+        xref_offset (int): Offset of the newest 'xref' keyword
+
+    Returns:
+        tuple: (offsets, root) with object number -> byte offset for in-use objects and
+               the object number of the document catalog; None if the file uses
+               cross-reference streams or the table cannot be read
+    """
+    offsets = {}
+    root = None
+    seen = set()
+
+    while xref_offset is not None and xref_offset not in seen:
+        seen.add(xref_offset)
+        if data[xref_offset:xref_offset + 4] != b'xref':
+            # Cross-reference stream (PDF 1.5+): objects may live in compressed streams
+            return None
+
+        trailer_pos = data.find(b'trailer', xref_offset)
+        if trailer_pos == -1:
+            return None
+
+        pos = xref_offset + 4
+        while pos < trailer_pos:
+            match = _XREF_SUBSECTION_RE.match(data, pos)
+            if not match:
+                break
+            first, count = int(match.group(1)), int(match.group(2))
+            pos = match.end()
+            for number in range(first, first + count):
+                # Entries are 'nnnnnnnnnn ggggg n'; newer sections take precedence
+                entry = _XREF_ENTRY_RE.match(data, pos)
+                if not entry:
+                    return None
+                if entry.group(3) == b'n':
+                    offsets.setdefault(number, int(entry.group(1)))
+                pos = entry.end()
+
+        trailer = data[trailer_pos:data.find(b'>>', trailer_pos) + 2]
+        if root is None:
+            root_match = _TRAILER_ROOT_RE.search(trailer)
+            root = int(root_match.group(1)) if root_match else None
+        prev_match = _TRAILER_PREV_RE.search(trailer)
+        xref_offset = int(prev_match.group(1)) if prev_match else None
+
+    if root is None:
+        return None
+    return offsets, root
+
+
+def _pdf_page_count_from_xref(data):
+    """
+    Read the page count of a PDF from its trailer, catalog and page tree root.
+
+    Only a handful of small slices of the file are touched; the object graph is never
+    built. Returns None whenever the file does not follow the simple layout (e.g.
+    cross-reference streams), so the caller can fall back to a full parser.
+    """
+    tail = data[max(len(data) - _PDF_TAIL_WINDOW, 0):]
+    matches = _STARTXREF_RE.findall(tail)
+    if not matches:
+        return None
+
+    xref = _xref_offsets(data, int(matches[-1]))
+    if xref is None:
+        return None
+    offsets, root = xref
+
+    catalog = _read_object(data, offsets, root)
+    pages_match = _CATALOG_PAGES_RE.search(catalog) if catalog is not None else None
+    if not pages_match:
+        return None
+
+    page_tree = _read_object(data, offsets, int(pages_match.group(1)))
+    count_match = _PAGES_COUNT_RE.search(page_tree) if page_tree is not None else None
+    return int(count_match.group(1)) if count_match else None
+
+
+def _pdf_page_count(file_path):
+    """Count the pages of a PDF, trying the cross-reference table before a full PyPDF2 parse"""
+    try:
+        with open(file_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                page_count = _pdf_page_count_from_xref(data)
+        if page_count is not None:
+            return page_count
+    except (OSError, ValueError) as e:
+        logger.debug(f"Could not read PDF trailer of {file_path}: {str(e)}")
+
+    logger.debug(f"Falling back to a full PDF parse to count pages of {file_path}")
+    try:
+        from PyPDF2 import PdfReader
+        with open(file_path, 'rb') as f:
+            return len(PdfReader(f).pages)
+    except Exception as e:
+        logger.warning(f"Could not count pages of {file_path}: {str(e)}")
+        return None
+
+
+def sniff_file(file_path, content_hash=None):
+    """
+    Identify a file from its leading bytes and, for PDFs, read its page count.
+
+    Results are cached by content hash, so the validation on upload and the OCR stage
+    share one look at the file.
+
+    Args:
+        file_path (str): Path to the file
+        content_hash (str, optional): SHA-256 of the file; enables caching
+
+    Returns:
+        dict: kind ('pdf', 'png', 'jpeg', 'tiff' or None), pageCount (None if unknown)
+              and size in bytes
+    """
+    if content_hash:
+        with _file_info_cache_lock:
+            info = _file_info_cache.get(content_hash)
+            if info is not None:
+                _file_info_cache.move_to_end(content_hash)
+                return dict(info)
+
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        head = f.read(_PDF_HEADER_WINDOW)
+
+    kind = _sniff_kind(head)
+    if kind == KIND_PDF:
+        page_count = _pdf_page_count(file_path)
+    elif kind in (KIND_PNG, KIND_JPEG):
+        page_count = 1
+    else:
+        page_count = None
+
+    info = {"kind": kind, "pageCount": page_count, "size": size}
+
+    if content_hash:
+        with _file_info_cache_lock:
+            _file_info_cache[content_hash] = info
+            while len(_file_info_cache) > FILE_INFO_CACHE_SIZE:
+                _file_info_cache.popitem(last=False)
+    return dict(info)
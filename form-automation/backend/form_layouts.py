@@ -0,0 +1,153 @@
+# form_layouts.py
+import os
+import json
+import glob
+import logging
+import threading
+from collections import namedtuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Directory holding one JSON layout file per form template
+FORM_LAYOUT_DIR = os.environ.get('FORM_LAYOUT_DIR', './form_layouts')
+
+# Field types a layout can declare
+FIELD_TEXT = 'text'
+FIELD_MULTILINE = 'multiline'
+FIELD_CHECKBOX = 'checkbox'
+
+# A field ready to draw: bottom-origin position, resolved font, and the form data keys
+# to look the value up under (the field name first, then its aliases)
+CompiledField = namedtuple('CompiledField', ['name', 'keys', 'x', 'y', 'font', 'size', 'type', 'mark'])
+
+
+class FormLayout:
+    """
+    Compiled field layout of one form template.
+
+    Layout files describe fields the way they are measured on the template: x/y in
+    points with y counted from the top of the page (set "fromTop": false on a field to
+    give y from the bottom). Compiling converts every position to the PDF's bottom-left
+    origin, applies the default font and size, and attaches the alias keys, so filling
+    a form is a flat loop over precomputed fields.
+    """
+
+    def __init__(self, spec, source=None):
+        """
+        Args:
+            spec (dict): Parsed layout file
+            source (str, optional): Path the layout was loaded from (for error messages)
+        """
+        self.form_type = spec['formType']
+        self.template_path = spec['template']
+        self.filename_prefix = spec.get('filenamePrefix', self.form_type)
+        self.page_height = spec.get('pageHeight', 792)
+        self.source = source
+
+        defaults = spec.get('defaults', {})
+        aliases = spec.get('aliases', {})
+
+        self.pages = {}
+        for page_num, fields in spec.get('pages', {}).items():
+            compiled = []
+            for name, field in fields.items():
+                field_type = field.get('type', FIELD_TEXT)
+                if field_type not in (FIELD_TEXT, FIELD_MULTILINE, FIELD_CHECKBOX):
+                    raise ValueError(f"Unknown field type '{field_type}' for {name} in {source or self.form_type}")
+
+                font = field.get('font', defaults.get('font', 'Helvetica'))
+                y = field['y']
+                if field.get('fromTop', True):
+                    y = self.page_height - y
+
+                compiled.append(CompiledField(
+                    name=name,
+                    keys=(name,) + tuple(aliases.get(name, ())),
+                    x=field['x'],
+                    y=y,
+                    font=font,
+                    size=field.get('size', defaults.get('size', 10)),
+                    type=field_type,
+                    # Checkmark glyph in ZapfDingbats, a plain X in any other font
+                    mark='4' if font == 'ZapfDingbats' else 'X'
+                ))
+            self.pages[int(page_num)] = tuple(compiled)
+
+    def fields_for_page(self, page_num):
+        """Return the compiled fields of a page (empty for pages without fields)"""
+        return self.pages.get(page_num, ())
+
+
+def resolve_field_value(field, form_data):
+    """
+    Look up the value to draw for a field.
+
+    The field's own key is used when it holds a non-empty value; otherwise the first
+    alias present in the form data (e.g. member_name or recipient_name for child_name).
+
+    Args:
+        field (CompiledField): Field to resolve
+        form_data (dict): Form data
+
+    Returns:
+        The value, or None when the form data has nothing for the field
+    """
+    value = form_data.get(field.name)
+    if value:
+        return value
+    for alias in field.keys[1:]:
+        if form_data.get(alias) is not None:
+            return form_data[alias]
+    return None
+
+
+def load_form_layouts(directory=FORM_LAYOUT_DIR):
+    """
+    Load and compile every layout file in a directory.
+
+    Args:
+        directory (str): Directory containing *.json layout files
+
+    Returns:
+        dict: Form type -> FormLayout
+    """
+    layouts = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            layout = FormLayout(json.load(f), source=path)
+        layouts[layout.form_type] = layout
+        logger.info(f"Loaded form layout '{layout.form_type}' from {path}")
+    return layouts
+
+
+_form_layouts = None
+_form_layouts_lock = threading.Lock()
+
+
+def get_form_layouts():
+    """Return the compiled layouts of all forms, loading them on first use"""
+    global _form_layouts
+    with _form_layouts_lock:
+        if _form_layouts is None:
+            _form_layouts = load_form_layouts()
+        return _form_layouts
+
+
+def get_form_layout(form_type):
+    """
+    Return the compiled layout of a form.
+
+    Args:
+        form_type (str): Form type, e.g. 'ibhs' or 'communityCare'
+
+    Returns:
+        FormLayout: Compiled layout
+
+    Raises:
+        ValueError: If no layout exists for the form type
+    """
+    layout = get_form_layouts().get(form_type)
+    if layout is None:
+        raise ValueError(f"Unknown form type: {form_type}")
+    return layout
@@ -0,0 +1,461 @@
+# form_rendering.py
+import io
+import os
+import json
+import logging
+import time
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# reportlab and PyPDF2 are imported by the functions that draw PDFs: forms are rendered
+# in the render pool, so the web process rarely needs them
+
+from template_registry import get_template_registry
+from form_layouts import get_form_layout, resolve_field_value, FIELD_CHECKBOX, FIELD_MULTILINE
+from metrics import observe_stage, stage_timer, STAGE_PDF_RENDER
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Worker processes rendering forms; PDF drawing and merging are CPU-bound, so forms
+# render in separate processes rather than threads
+FORM_RENDER_WORKERS = int(os.environ.get('FORM_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """Return the process-wide form rendering pool, creating it on first use"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # Spawned rather than forked: the server process runs job queue threads
+            _render_pool = ProcessPoolExecutor(max_workers=FORM_RENDER_WORKERS,
+                                               mp_context=multiprocessing.get_context('spawn'))
+            logger.info(f"Form render pool started with {FORM_RENDER_WORKERS} processes")
+        return _render_pool
+
+
+def render_form(form_type, output, form_data):
+    """
+    Render one form: fill its template, or draw it from scratch when the template is
+    missing or cannot be filled.
+
+    Args:
+        form_type (str): Form type, e.g. 'ibhs' or 'communityCare'
+        output (str or file): Path to write the PDF to, or a binary file object
+        form_data (dict): Data for this form
+
+    Returns:
+        str: 'template' or 'fallback', depending on how the form was produced
+    """
+    layout = get_form_layout(form_type)
+
+    if os.path.exists(layout.template_path):
+        if fill_pdf_template(layout.template_path, output, form_data, form_type):
+            return 'template'
+        logger.error(f"Failed to fill {form_type} template, falling back to direct generation")
+    else:
+        logger.warning(f"Template file not found for {form_type}, using direct PDF generation")
+
+    fallback = FALLBACK_GENERATORS.get(form_type)
+    if fallback is None:
+        raise ValueError(f"No direct PDF generator for form type: {form_type}")
+    if hasattr(output, 'write'):
+        # Discard anything a failed template fill left in the buffer
+        output.seek(0)
+        output.truncate()
+    fallback(output, form_data)
+    return 'fallback'
+
+
+def render_form_bytes(form_type, form_data):
+    """
+    Render one form in memory.
+
+    Args:
+        form_type (str): Form type
+        form_data (dict): Data for this form
+
+    Returns:
+        tuple: ('template' or 'fallback', PDF bytes)
+    """
+    buffer = io.BytesIO()
+    method = render_form(form_type, buffer, form_data)
+    return method, buffer.getvalue()
+
+
+def _render_in_process(func, form_type, args):
+    """Run a render job in this process, timing it as a render stage"""
+    with stage_timer(STAGE_PDF_RENDER, form=form_type):
+        return func(*args)
+
+
+def _observe_render(form_type, start_time):
+    """Return a future callback recording the render time (including queueing) of a form"""
+    def callback(future):
+        if not future.cancelled() and future.exception() is None:
+            observe_stage(STAGE_PDF_RENDER, time.time() - start_time, form=form_type)
+    return callback
+
+
+def _run_in_render_pool(func, jobs):
+    """
+    Run func once per form in the render pool.
+
+    Args:
+        func (callable): Module-level function (it is pickled to the worker processes)
+        jobs (dict): Form type -> positional arguments for func
+
+    Returns:
+        dict: Form type -> return value of func
+    """
+    global _render_pool
+
+    try:
+        pool = get_render_pool()
+        futures = {}
+        for form_type, args in jobs.items():
+            futures[form_type] = pool.submit(func, *args)
+            futures[form_type].add_done_callback(_observe_render(form_type, time.time()))
+    except Exception as e:
+        logger.error(f"Form render pool unavailable, rendering in process: {str(e)}")
+        return {form_type: _render_in_process(func, form_type, args) for form_type, args in jobs.items()}
+
+    results = {}
+    for form_type, future in futures.items():
+        try:
+            results[form_type] = future.result()
+        except BrokenProcessPool as e:
+            # A crashed worker should not take form generation down; start a fresh pool next time
+            logger.error(f"Form render pool broke while rendering {form_type}, rendering in process: {str(e)}")
+            with _render_pool_lock:
+                if _render_pool is pool:
+                    _render_pool = None
+            results[form_type] = _render_in_process(func, form_type, jobs[form_type])
+    return results
+
+
+def render_forms(forms):
+    """
+    Render several forms to disk concurrently in the render pool. Each form falls back
+    to direct generation on its own, so one failing template never re-renders the others.
+
+    Args:
+        forms (list): (form_type, output_path, form_data) tuples
+
+    Returns:
+        dict: Form type -> 'template' or 'fallback'
+
+    Raises:
+        Exception: If a form could not be produced at all
+    """
+    return _run_in_render_pool(render_form, {
+        form_type: (form_type, output_path, form_data)
+        for form_type, output_path, form_data in forms
+    })
+
+
+def render_forms_to_bytes(forms):
+    """
+    Render several forms in memory concurrently in the render pool.
+
+    Args:
+        forms (dict): Form type -> form data
+
+    Returns:
+        dict: Form type -> ('template' or 'fallback', PDF bytes)
+
+    Raises:
+        Exception: If a form could not be produced at all
+    """
+    return _run_in_render_pool(render_form_bytes, {
+        form_type: (form_type, form_data)
+        for form_type, form_data in forms.items()
+    })
+
+
+def fill_pdf_template(template_path, output_path, form_data, form_type):
+    """
+    Fill a PDF template with form data by overlaying text at specific coordinates.
+    output_path may also be a binary file object (e.g. io.BytesIO).
+    """
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+    from PyPDF2 import PdfReader, PdfWriter
+
+    try:
+        # Compiled field layout for the form type (loaded once from form_layouts/)
+        layout = get_form_layout(form_type)
+        
+        # Debug the form data
+        logger.info(f"Form data for {form_type}: {json.dumps(form_data, indent=2)}")
+        
+        # Template pages are parsed once per template by the registry
+        template_registry = get_template_registry()
+        
+        # One overlay document for the whole form, with a page only for each
+        # template page that received content
+        packet = io.BytesIO()
+        c = canvas.Canvas(packet, pagesize=letter)
+        drawn_pages = []
+        
+        # Process each page
+        for page_num in range(template_registry.page_count(template_path)):
+            # Get fields for this page
+            page_fields = layout.fields_for_page(page_num)
+            
+            # Debug
+            logger.debug(f"Processing page {page_num} with {len(page_fields)} fields")
+            
+            # Flag to track if any content was drawn
+            content_drawn = False
+            
+            # Process each field; positions are already bottom-origin
+            for field in page_fields:
+                # Exact field name first, then its aliases
+                value = resolve_field_value(field, form_data)
+                if value is None or (field.type == FIELD_CHECKBOX and not value):
+                    continue
+                
+                c.setFont(field.font, field.size)
+                if field.type == FIELD_CHECKBOX:
+                    c.drawString(field.x, field.y, field.mark)
+                elif field.type == FIELD_MULTILINE and '\n' in str(value):
+                    # For multiline text
+                    line_height = field.size + 2
+                    current_y = field.y
+                    
+                    for line in str(value).split('\n'):
+                        c.drawString(field.x, current_y, line)
+                        current_y -= line_height
+                else:
+                    # Standard text
+                    c.drawString(field.x, field.y, str(value))
+                content_drawn = True
+            
+            # Pages without content get no overlay page and are copied unchanged
+            if content_drawn:
+                c.showPage()
+                drawn_pages.append(page_num)
+        
+        # Render and parse the overlay once, then map its pages back to template pages
+        overlays = {}
+        if drawn_pages:
+            c.save()
+            packet.seek(0)
+            overlay_pdf = PdfReader(packet)
+            overlays = dict(zip(drawn_pages, overlay_pdf.pages))
+        
+        output_pdf = PdfWriter()
+        template_registry.fill_into(template_path, output_pdf, overlays)
+        
+        # Write the output PDF
+        if hasattr(output_path, 'write'):
+            output_pdf.write(output_path)
+            logger.info(f"Successfully created filled {form_type} PDF in memory")
+        else:
+            with open(output_path, "wb") as output_file:
+                output_pdf.write(output_file)
+            logger.info(f"Successfully created filled PDF at {output_path}")
+        return True
+    
+    except Exception as e:
+        logger.error(f"Error filling PDF template: {str(e)}")
+        logger.error(traceback.format_exc())
+        return False
+
+def generate_ibhs_pdf(filepath, form_data):
+    """Generate IBHS form PDF using reportlab"""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+
+    c = canvas.Canvas(filepath, pagesize=letter)
+    width, height = letter
+    
+    # Set up the document
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(width/2, height - 50, "WRITTEN ORDER FOR IBHS")
+    
+    # Add form data
+    y_position = height - 100
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, y_position, "Child Information")
+    y_position -= 20
+    
+    c.setFont("Helvetica", 10)
+    c.drawString(50, y_position, f"Child's Name: {form_data.get('child_name', 'N/A')}")
+    y_position -= 15
+    c.drawString(50, y_position, f"Date of Birth: {form_data.get('dob', 'N/A')}")
+    y_position -= 15
+    c.drawString(50, y_position, f"Parent/Guardian: {form_data.get('parent_guardian', 'N/A')}")
+    y_position -= 30
+    
+    # Diagnoses
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, y_position, "Current Behavioral Health Diagnoses")
+    y_position -= 20
+    c.setFont("Helvetica", 10)
+    
+    diagnoses = form_data.get('current_diagnoses', 'None specified')
+    # Handle either string or list for diagnoses
+    if isinstance(diagnoses, list):
+        for diagnosis in diagnoses:
+            c.drawString(50, y_position, str(diagnosis))
+            y_position -= 15
+    else:
+        # If it's a string, split by newlines
+        for line in str(diagnoses).split('\n'):
+            c.drawString(50, y_position, line)
+            y_position -= 15
+    y_position -= 15
+    
+    # Goals
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, y_position, "Measurable Goals and Objectives")
+    y_position -= 20
+    c.setFont("Helvetica", 10)
+    
+    # Get goals from either measurable_goals or treatment_goals field
+    goals = form_data.get('measurable_goals', form_data.get('treatment_goals', 'None specified'))
+    
+    # Handle either string or list for goals
+    if isinstance(goals, list):
+        for goal in goals:
+            c.drawString(50, y_position, str(goal))
+            y_position -= 15
+    else:
+        # If it's a string, split by newlines
+        for line in str(goals).split('\n'):
+            c.drawString(50, y_position, line)
+            y_position -= 15
+    
+    # Save the PDF
+    c.save()
+
+def generate_community_care_pdf(filepath, form_data):
+    """Generate Community Care form PDF using reportlab"""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+
+    c = canvas.Canvas(filepath, pagesize=letter)
+    width, height = letter
+    
+    # Set up the document
+    c.setFont("Helvetica-Bold", 16)
+    c.drawCentredString(width/2, height - 50, "COMMUNITY CARE IBHS WRITTEN ORDER LETTER")
+    
+    # Add form data
+    y_position = height - 100
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, y_position, "Recipient Information")
+    y_position -= 20
+    
+    c.setFont("Helvetica", 10)
+    c.drawString(50, y_position, f"Name: {form_data.get('recipient_name', form_data.get('member_name', 'N/A'))}")
+    y_position -= 15
+    c.drawString(50, y_position, f"Date of Birth: {form_data.get('dob', form_data.get('member_dob', 'N/A'))}")
+    y_position -= 15
+    c.drawString(50, y_position, f"Age: {form_data.get('age', 'N/A')}")
+    y_position -= 30
+    
+    # Diagnoses
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, y_position, "Current Diagnoses")
+    y_position -= 20
+    c.setFont("Helvetica", 10)
+    
+    # Get diagnoses from either field
+    diagnoses = form_data.get('diagnoses', form_data.get('diagnosis', 'None specified'))
+    
+    # Handle different data types for diagnoses
+    if isinstance(diagnoses, list):
+        for diagnosis in diagnoses:
+            if isinstance(diagnosis, dict):
+                # Handle dict format with name and code
+                name = diagnosis.get('name', '')
+                code = diagnosis.get('code', '')
+                text = f"{name} ({code})" if code else name
+                c.drawString(50, y_position, text)
+            else:
+                # Handle plain text or other format
+                c.drawString(50, y_position, str(diagnosis))
+            y_position -= 15
+    else:
+        # If it's a string, split by newlines
+        for line in str(diagnoses).split('\n'):
+            c.drawString(50, y_position, line)
+            y_position -= 15
+    y_position -= 15
+    
+    # Clinical Presentation
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, y_position, "Clinical Presentation/Symptoms")
+    y_position -= 20
+    c.setFont("Helvetica", 10)
+    
+    symptoms = form_data.get('symptoms', form_data.get('clinical_summary', 'None specified'))
+    
+    # Handle different data types for symptoms
+    if isinstance(symptoms, list):
+        for symptom in symptoms:
+            c.drawString(50, y_position, str(symptom))
+            y_position -= 15
+    else:
+        # If it's a string, split by newlines
+        for line in str(symptoms).split('\n'):
+            c.drawString(50, y_position, line)
+            y_position -= 15
+    
+    y_position -= 15
+    
+    # Treatment Recommendations
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, y_position, "Treatment Recommendations")
+    y_position -= 20
+    c.setFont("Helvetica", 10)
+    
+    recommendations = form_data.get('treatment_recommendations', form_data.get('treatment_plan', 'None specified'))
+    
+    # Handle different data types for recommendations
+    if isinstance(recommendations, list):
+        for recommendation in recommendations:
+            c.drawString(50, y_position, str(recommendation))
+            y_position -= 15
+    else:
+        # If it's a string, split by newlines
+        for line in str(recommendations).split('\n'):
+            # Check if the line is too long
+            if len(line) > 90:  # Approximate character limit per line
+                words = line.split()
+                current_line = ""
+                
+                for word in words:
+                    if len(current_line) + len(word) + 1 <= 90:
+                        current_line += " " + word if current_line else word
+                    else:
+                        c.drawString(50, y_position, current_line)
+                        y_position -= 15
+                        current_line = word
+                
+                # Draw the last line if there's any content left
+                if current_line:
+                    c.drawString(50, y_position, current_line)
+                    y_position -= 15
+            else:
+                c.drawString(50, y_position, line)
+                y_position -= 15
+    
+    # Save the PDF
+    c.save()
+
+
+# Direct generators used when a form's template is missing or cannot be filled
+FALLBACK_GENERATORS = {
+    'ibhs': generate_ibhs_pdf,
+    'communityCare': generate_community_care_pdf
+}
@@ -0,0 +1,282 @@
+# janitor.py
+import os
+import time
+import logging
+import threading
+import traceback
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# How often the janitor sweeps, in seconds
+JANITOR_INTERVAL = float(os.environ.get('JANITOR_INTERVAL', 300))
+# Files younger than this are never removed, so uploads still being processed and
+# freshly generated forms survive a sweep even when a directory is over its size cap
+JANITOR_MIN_AGE = float(os.environ.get('JANITOR_MIN_AGE', 600))
+
+
+def touch_accessed(file_path):
+    """
+    Mark a file as recently used without changing its modification time.
+
+    Filesystems mounted with noatime/relatime do not reliably update the access time
+    on reads, so code serving files calls this to keep the janitor's LRU order right.
+
+    Args:
+        file_path (str): Path to the file
+    """
+    try:
+        stat = os.stat(file_path)
+        os.utime(file_path, (time.time(), stat.st_mtime))
+    except OSError:
+        pass
+
+
+class DirectoryJanitor:
+    """
+    Keeps one directory bounded in age and size.
+
+    A sweep deletes every file older than ttl seconds, then, while the directory is
+    still larger than max_bytes, deletes the least-recently-used remaining files
+    (by access time). Files younger than min_age are left alone in both passes, and
+    files still in use (e.g. uploads of queued jobs) are never evicted for size.
+    """
+
+    def __init__(self, directory, ttl=None, max_bytes=None, min_age=JANITOR_MIN_AGE):
+        """
+        Args:
+            directory (str): Directory to clean (not recursed into)
+            ttl (float, optional): Maximum file age in seconds, counted from the last modification
+            max_bytes (int, optional): Size bound for all files in the directory together
+            min_age (float): Grace period in seconds for new files
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self.stats = {
+            "directory": directory,
+            "sweeps": 0,
+            "filesRemoved": 0,
+            "bytesReclaimed": 0,
+            "files": 0,
+            "bytes": 0,
+            "lastSweepAt": None,
+            "lastSweepSeconds": None
+        }
+
+    def _scan(self):
+        """Return (path, size, mtime, last_used) for every regular file in the directory"""
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    try:
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    entries.append((entry.path, stat.st_size, stat.st_mtime,
+                                    max(stat.st_atime, stat.st_mtime)))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def sweep(self, now=None, in_use=frozenset()):
+        """
+        Remove expired files, then least-recently-used files until the size cap is met.
+
+        Args:
+            now (float, optional): Current time (defaults to time.time())
+            in_use (set): Absolute paths the size cap must not evict
+
+        Returns:
+            dict: Files removed and bytes reclaimed by this sweep
+        """
+        start_time = time.time()
+        now = now if now is not None else start_time
+        entries = self._scan()
+        removed = 0
+        reclaimed = 0
+
+        def remove(path, size):
+            nonlocal removed, reclaimed
+            try:
+                os.unlink(path)
+            except OSError:
+                return False
+            removed += 1
+            reclaimed += size
+            return True
+
+        kept = []
+        for path, size, mtime, last_used in entries:
+            age = now - mtime
+            if self.ttl is not None and age > self.ttl and age > self.min_age:
+                if remove(path, size):
+                    continue
+            kept.append((path, size, mtime, last_used))
+
+        total = sum(size for _, size, _, _ in kept)
+        if self.max_bytes is not None and total > self.max_bytes:
+            for path, size, mtime, _ in sorted(kept, key=lambda entry: entry[3]):
+                if total <= self.max_bytes:
+                    break
+                if now - mtime <= self.min_age or os.path.abspath(path) in in_use:
+                    continue
+                if remove(path, size):
+                    total -= size
+
+        self.stats["sweeps"] += 1
+        self.stats["filesRemoved"] += removed
+        self.stats["bytesReclaimed"] += reclaimed
+        self.stats["files"] = len(entries) - removed
+        self.stats["bytes"] = sum(size for _, size, _, _ in entries) - reclaimed
+        self.stats["lastSweepAt"] = now
+        self.stats["lastSweepSeconds"] = round(time.time() - start_time, 3)
+
+        if removed:
+            logger.info(f"Janitor removed {removed} files ({reclaimed} bytes) from {self.directory}")
+        return {"filesRemoved": removed, "bytesReclaimed": reclaimed}
+
+
+class Janitor:
+    """
+    Background thread sweeping a set of directories at a fixed interval.
+    """
+
+    def __init__(self, directories, interval=JANITOR_INTERVAL):
+        """
+        Args:
+            directories (list): DirectoryJanitor instances to sweep
+            interval (float): Seconds between sweeps
+        """
+        self.directories = directories
+        self.interval = interval
+        self._tasks = []
+        self._in_use = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the sweeping thread if it is not running yet"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="file-janitor", daemon=True)
+        self._thread.start()
+        logger.info(f"File janitor started for {[d.directory for d in self.directories]} "
+                    f"(every {self.interval}s)")
+
+    def stop(self):
+        """Stop the sweeping thread"""
+        self._stop.set()
+
+    def add_task(self, task):
+        """
+        Run an extra cleanup callable on every sweep (e.g. purging expired jobs).
+
+        Args:
+            task (callable): Called without arguments
+        """
+        with self._lock:
+            self._tasks.append(task)
+
+    def set_in_use(self, in_use):
+        """
+        Tell the janitor which files are still needed.
+
+        Args:
+            in_use (callable): Returns a set of absolute paths; called once per sweep
+        """
+        with self._lock:
+            self._in_use = in_use
+
+    def sweep(self):
+        """Sweep every directory once, run the extra tasks, and return the per-directory results"""
+        results = {}
+        with self._lock:
+            try:
+                in_use = set(self._in_use()) if self._in_use else set()
+            except Exception as e:
+                # Without knowing which files are still needed, no directory is swept
+                logger.error(f"Janitor could not list files in use: {str(e)}")
+                logger.error(traceback.format_exc())
+                in_use = None
+            for directory in self.directories:
+                if in_use is None:
+                    break
+                try:
+                    results[directory.directory] = directory.sweep(in_use=in_use)
+                except Exception as e:
+                    logger.error(f"Janitor sweep of {directory.directory} failed: {str(e)}")
+                    logger.error(traceback.format_exc())
+            for task in self._tasks:
+                try:
+                    task()
+                except Exception as e:
+                    logger.error(f"Janitor task failed: {str(e)}")
+                    logger.error(traceback.format_exc())
+        return results
+
+    def get_stats(self):
+        """Return cumulative statistics of every directory"""
+        with self._lock:
+            return [dict(directory.stats) for directory in self.directories]
+
+    def collect_metrics(self):
+        """
+        Metrics collector (see metrics.MetricsRegistry.add_collector) exporting directory
+        sizes and what the janitor reclaimed.
+        """
+        stats = self.get_stats()
+        return [
+            ("storage_files", "gauge", "Files in a managed directory after the last sweep",
+             [({"directory": s["directory"]}, s["files"]) for s in stats]),
+            ("storage_bytes", "gauge", "Bytes in a managed directory after the last sweep",
+             [({"directory": s["directory"]}, s["bytes"]) for s in stats]),
+            ("janitor_files_removed_total", "counter", "Files removed by the janitor",
+             [({"directory": s["directory"]}, s["filesRemoved"]) for s in stats]),
+            ("janitor_bytes_reclaimed_total", "counter", "Bytes reclaimed by the janitor",
+             [({"directory": s["directory"]}, s["bytesReclaimed"]) for s in stats])
+        ]
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.sweep()
+            self._stop.wait(self.interval)
+
+
+def _env_number(name, default):
+    """Read a numeric setting; empty or 0 disables the limit"""
+    value = float(os.environ.get(name, default) or 0)
+    return value if value > 0 else None
+
+
+_janitor = None
+_janitor_lock = threading.Lock()
+
+
+def get_janitor(upload_folder='./uploads', download_folder='./downloads'):
+    """
+    Return the process-wide janitor for the upload and download folders, creating it on first use.
+
+    Limits come from UPLOAD_TTL / UPLOAD_MAX_BYTES and DOWNLOAD_TTL / DOWNLOAD_MAX_BYTES
+    (seconds and bytes; 0 disables a limit).
+    """
+    global _janitor
+    with _janitor_lock:
+        if _janitor is None:
+            max_upload_bytes = _env_number('UPLOAD_MAX_BYTES', 2 * 1024 * 1024 * 1024)
+            max_download_bytes = _env_number('DOWNLOAD_MAX_BYTES', 1024 * 1024 * 1024)
+            _janitor = Janitor([
+                DirectoryJanitor(upload_folder,
+                                 ttl=_env_number('UPLOAD_TTL', 24 * 3600),
+                                 max_bytes=int(max_upload_bytes) if max_upload_bytes else None),
+                DirectoryJanitor(download_folder,
+                                 ttl=_env_number('DOWNLOAD_TTL', 24 * 3600),
+                                 max_bytes=int(max_download_bytes) if max_download_bytes else None)
+            ])
+        return _janitor
@@ -0,0 +1,354 @@
+# job_queue.py
+import os
+import json
+import sqlite3
+import logging
+import threading
+import traceback
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Job states
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+# Jobs in these states still need their input files
+ACTIVE_JOB_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+# Finished jobs (records, results and events) are deleted this many seconds after they end;
+# results hold patient data, so they are kept only long enough for the client to fetch them
+JOB_RETENTION = float(os.environ.get('JOB_RETENTION', 3600))
+# Expired jobs are purged at most this often, when new jobs are created
+JOB_PURGE_INTERVAL = float(os.environ.get('JOB_PURGE_INTERVAL', 60))
+
+
+class InMemoryJobStore:
+    """
+    Job store backed by a dictionary. Jobs are only visible to the process that created them.
+
+    Any object exposing create(), update(), get(), add_event(), get_events(),
+    active_files() and purge_finished() with the same signatures can be used as a store (e.g. a Redis-backed one for multi-host deployments).
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        """Persist a newly created job record"""
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+            self._events[job['id']] = []
+
+    def update(self, job_id, **fields):
+        """Update fields of an existing job record"""
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        """Return a copy of the job record, or None if it does not exist"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def add_event(self, job_id, event):
+        """Append a progress event to a job and return its sequence number"""
+        with self._lock:
+            events = self._events.setdefault(job_id, [])
+            events.append(dict(event, seq=len(events) + 1))
+            return len(events)
+
+    def get_events(self, job_id, after_seq=0):
+        """Return the progress events of a job with a sequence number above after_seq"""
+        with self._lock:
+            return [dict(event) for event in self._events.get(job_id, []) if event['seq'] > after_seq]
+
+    def active_files(self):
+        """Return the input files of all queued and running jobs"""
+        with self._lock:
+            return {path for job in self._jobs.values() if job.get('status') in ACTIVE_JOB_STATES
+                    for path in job.get('files') or ()}
+
+    def purge_finished(self, finished_before):
+        """Delete jobs that finished before the given time, with their events; return how many"""
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.get('finishedAt') is not None and job['finishedAt'] < finished_before]
+            for job_id in expired:
+                del self._jobs[job_id]
+                self._events.pop(job_id, None)
+            return len(expired)
+
+
+class SQLiteJobStore:
+    """
+    Job store backed by a local SQLite file, so job status can be read from any
+    worker process on the same host.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, "
+                "data TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                "job_id TEXT NOT NULL, "
+                "seq INTEGER NOT NULL, "
+                "data TEXT NOT NULL, "
+                "PRIMARY KEY (job_id, seq))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create(self, job):
+        """Persist a newly created job record"""
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT INTO jobs (id, data) VALUES (?, ?)", (job['id'], json.dumps(job)))
+
+    def update(self, job_id, **fields):
+        """Update fields of an existing job record"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            job = json.loads(row[0])
+            job.update(fields)
+            conn.execute("UPDATE jobs SET data = ? WHERE id = ?", (json.dumps(job), job_id))
+
+    def get(self, job_id):
+        """Return the job record, or None if it does not exist"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_event(self, job_id, event):
+        """Append a progress event to a job and return its sequence number"""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = ?", (job_id,)).fetchone()
+            seq = row[0] + 1
+            conn.execute("INSERT INTO job_events (job_id, seq, data) VALUES (?, ?, ?)",
+                         (job_id, seq, json.dumps(dict(event, seq=seq))))
+            return seq
+
+    def get_events(self, job_id, after_seq=0):
+        """Return the progress events of a job with a sequence number above after_seq"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                                (job_id, after_seq)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def active_files(self):
+        """Return the input files of all queued and running jobs"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT json_extract(data, '$.files') FROM jobs WHERE json_extract(data, '$.status') IN (?, ?)",
+                ACTIVE_JOB_STATES).fetchall()
+        return {path for row in rows if row[0] for path in json.loads(row[0])}
+
+    def purge_finished(self, finished_before):
+        """Delete jobs that finished before the given time, with their events; return how many"""
+        with self._lock, self._connect() as conn:
+            expired = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE json_extract(data, '$.finishedAt') < ?", (finished_before,))]
+            for job_id in expired:
+                conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            return len(expired)
+
+
+class JobQueue:
+    """
+    In-process worker pool that runs long-running jobs in the background and records
+    their status and result in a job store.
+    """
+
+    def __init__(self, store, max_workers=8, retention=JOB_RETENTION):
+        """
+        Args:
+            store: Job store (InMemoryJobStore, SQLiteJobStore or compatible)
+            max_workers (int): Number of worker threads
+            retention (float): Seconds a finished job is kept; 0 keeps jobs forever
+        """
+        self.store = store
+        self.retention = retention
+        self._last_purge = 0.0
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+        logger.info(f"Job queue started with {max_workers} workers using {type(store).__name__}")
+
+    def submit(self, func, *args, job_type='job', **kwargs):
+        """
+        Enqueue a job and return immediately.
+
+        Args:
+            func (callable): Function to run; its return value becomes the job result
+            job_type (str): Label stored with the job
+
+        Returns:
+            str: ID of the queued job
+        """
+        job_id = self.create(job_type)
+        self.start(job_id, func, *args, **kwargs)
+        return job_id
+
+    def create(self, job_type='job', files=None):
+        """
+        Register a job without starting it, so progress events can be published
+        before the work is handed to the pool.
+
+        Args:
+            job_type (str): Label stored with the job
+            files (list, optional): Input files the job reads; the janitor does not evict
+                                    them while the job is queued or running
+
+        Returns:
+            str: ID of the new job
+        """
+        self._purge_if_due()
+        job_id = str(uuid.uuid4())
+        self.store.create({
+            "id": job_id,
+            "type": job_type,
+            "status": JOB_QUEUED,
+            "createdAt": time.time(),
+            "startedAt": None,
+            "finishedAt": None,
+            "result": None,
+            "error": None,
+            "files": [os.path.abspath(path) for path in files or ()]
+        })
+        return job_id
+
+    def start(self, job_id, func, *args, with_progress=False, **kwargs):
+        """
+        Hand a created job to the worker pool.
+
+        Args:
+            job_id (str): ID returned by create()
+            func (callable): Function to run; its return value becomes the job result
+            with_progress (bool): Pass a progress(stage, **data) callback to func that
+                                  publishes events for this job
+        """
+        if with_progress:
+            kwargs['progress'] = lambda stage, **data: self.publish(job_id, stage, **data)
+        self.executor.submit(self._run, job_id, func, args, kwargs)
+        logger.info(f"Queued job {job_id}")
+
+    def get(self, job_id):
+        """Return the job record, or None if it does not exist"""
+        return self.store.get(job_id)
+
+    def active_files(self):
+        """Return the absolute paths of the input files of all queued and running jobs"""
+        return self.store.active_files()
+
+    def purge_expired(self, now=None):
+        """
+        Delete finished jobs older than the retention period.
+
+        Args:
+            now (float, optional): Current time (defaults to time.time())
+
+        Returns:
+            int: Number of jobs deleted
+        """
+        if not self.retention:
+            return 0
+        now = now if now is not None else time.time()
+        self._last_purge = now
+        try:
+            purged = self.store.purge_finished(now - self.retention)
+        except Exception as e:
+            logger.error(f"Purging expired jobs failed: {str(e)}")
+            logger.error(traceback.format_exc())
+            return 0
+        if purged:
+            logger.info(f"Purged {purged} finished jobs older than {self.retention}s")
+        return purged
+
+    def _purge_if_due(self):
+        if time.time() - self._last_purge >= JOB_PURGE_INTERVAL:
+            self.purge_expired()
+
+    def publish(self, job_id, stage, **data):
+        """
+        Record a progress event for a job.
+
+        Args:
+            job_id (str): Job ID
+            stage (str): Name of the stage that was reached
+            **data: Extra JSON-serializable event fields
+        """
+        job = self.store.get(job_id)
+        elapsed = time.time() - job['createdAt'] if job else 0.0
+        self.store.add_event(job_id, dict(data, stage=stage, elapsed=round(elapsed, 3)))
+
+    def get_events(self, job_id, after_seq=0):
+        """Return the progress events of a job published after the given sequence number"""
+        return self.store.get_events(job_id, after_seq)
+
+    def _run(self, job_id, func, args, kwargs):
+        logger.info(f"Starting job {job_id}")
+        self.store.update(job_id, status=JOB_RUNNING, startedAt=time.time())
+        try:
+            result = func(*args, **kwargs)
+            self.store.update(job_id, status=JOB_SUCCEEDED, finishedAt=time.time(), result=result)
+            self.publish(job_id, JOB_SUCCEEDED, result=result)
+            logger.info(f"Job {job_id} completed")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            logger.error(traceback.format_exc())
+            error = f"Processing error: {str(e)}"
+            self.store.update(job_id, status=JOB_FAILED, finishedAt=time.time(), error=error)
+            self.publish(job_id, JOB_FAILED, error=error)
+
+
+def create_job_store(backend=None):
+    """
+    Create the job store selected by the JOB_STORE_BACKEND environment variable.
+
+    Args:
+        backend (str, optional): 'memory' or 'sqlite'
+
+    Returns:
+        Job store instance
+    """
+    backend = (backend or os.environ.get('JOB_STORE_BACKEND', 'memory')).lower()
+
+    if backend == 'sqlite':
+        db_path = os.environ.get('JOB_STORE_PATH', './jobs/jobs.db')
+        return SQLiteJobStore(db_path)
+    if backend != 'memory':
+        logger.warning(f"Unknown job store backend '{backend}', falling back to memory")
+    return InMemoryJobStore()
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue, creating it on first use"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            max_workers = int(os.environ.get('JOB_WORKERS', 8))
+            _job_queue = JobQueue(create_job_store(), max_workers=max_workers)
+        return _job_queue
@@ -0,0 +1,122 @@
+# llm_cache.py
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+
+from disk_cache import DiskCache
+from metrics import get_metrics, stage_timer, record_token_usage
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def _normalize_prompt(text):
+    """Collapse whitespace so cosmetic prompt re-indentation does not change the key"""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def llm_cache_key(model, messages, temperature, response_format=None):
+    """
+    Build the cache key for a chat completion request.
+
+    Args:
+        model (str): Model name
+        messages (list): Chat messages
+        temperature (float): Sampling temperature
+        response_format (dict, optional): Requested response format
+
+    Returns:
+        str: Cache key
+    """
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "response_format": response_format,
+        "messages": [
+            {"role": message["role"], "content": _normalize_prompt(message["content"])}
+            for message in messages
+        ]
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _is_complete_response(content, response_format=None):
+    """Whether content is usable as-is: non-empty and, for JSON responses, valid JSON"""
+    if not content:
+        return False
+    if (response_format or {}).get("type") == "json_object":
+        try:
+            json.loads(content)
+        except ValueError:
+            return False
+    return True
+
+
+def get_llm_cache():
+    """Return the process-wide LLM response cache, creating it on first use"""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            directory = os.environ.get('LLM_CACHE_DIR', './cache/llm')
+            max_bytes = int(os.environ.get('LLM_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+            ttl = float(os.environ.get('LLM_CACHE_TTL', 7 * 24 * 3600))
+            _llm_cache = DiskCache(directory, max_bytes=max_bytes, ttl=ttl)
+        return _llm_cache
+
+
+def cached_chat_completion(openai_client, model, messages, temperature, response_format=None, bypass_cache=False,
+                           stage='chat_completion'):
+    """
+    Call the OpenAI chat completions API, serving identical requests from the LLM cache.
+
+    Args:
+        openai_client (OpenAI): OpenAI client
+        model (str): Model name
+        messages (list): Chat messages
+        temperature (float): Sampling temperature
+        response_format (dict, optional): Requested response format
+        bypass_cache (bool): Skip the lookup and refresh the cached response
+        stage (str): Pipeline stage making the call, used to label its metrics
+
+    Returns:
+        str: Content of the first completion choice
+    """
+    cache = get_llm_cache()
+    cache_key = llm_cache_key(model, messages, temperature, response_format)
+
+    if not bypass_cache:
+        content = cache.get(cache_key)
+        # Entries written before replies were checked may be unusable; treat them as misses
+        if content is not None and _is_complete_response(content, response_format):
+            logger.info(f"LLM cache hit for {model} request")
+            get_metrics().inc('llm_cache_hits_total', help_text="LLM requests served from the cache",
+                              stage=stage, model=model)
+            return content
+
+    request = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature
+    }
+    if response_format is not None:
+        request["response_format"] = response_format
+
+    with stage_timer(stage, model=model):
+        response = openai_client.chat.completions.create(**request)
+    record_token_usage(stage, model, getattr(response, 'usage', None))
+    choice = response.choices[0]
+    content = choice.message.content
+
+    # Truncated or malformed replies are returned to the caller but never cached, so a
+    # single bad answer does not break the prompt for the whole cache TTL
+    if getattr(choice, 'finish_reason', None) == "stop" and _is_complete_response(content, response_format):
+        cache.set(cache_key, content)
+    else:
+        logger.warning(f"Not caching {model} response (finish_reason={getattr(choice, 'finish_reason', None)})")
+    return content
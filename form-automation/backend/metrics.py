@@ -0,0 +1,227 @@
+# metrics.py
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'form_automation'
+
+# Histogram bucket upper bounds in seconds, from fast local stages (validate, cache
+# lookups) up to multi-minute OCR of long scans
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+# Pipeline stages with a duration histogram
+STAGE_SAVE = 'save'
+STAGE_VALIDATE = 'validate'
+STAGE_MISTRAL_UPLOAD = 'mistral_upload'
+STAGE_SIGNED_URL = 'signed_url'
+STAGE_MISTRAL_OCR = 'mistral_ocr'
+STAGE_OCR = 'ocr'
+STAGE_PDF_RENDER = 'pdf_render'
+STAGE_DOWNLOAD = 'download'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    In-process store of counters and histograms, rendered in the Prometheus text format.
+
+    Single-process only: each process keeps its own numbers, and /api/metrics renders
+    only those of the process answering the scrape. Run the server as one process
+    (threads are fine). With several worker processes behind one port, scrapes land on
+    random workers, counters jump between them and quantiles come out wrong.
+    Percentiles are computed on the Prometheus side, e.g.
+    histogram_quantile(0.95, rate(form_automation_stage_duration_seconds_bucket[5m])).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> (type, help, {labels tuple: value or histogram state})
+        self._metrics = {}
+        self._collectors = []
+
+    def _series(self, name, metric_type, help_text):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = (metric_type, help_text, {})
+            self._metrics[name] = metric
+        return metric[2]
+
+    def inc(self, name, value=1, help_text='', **labels):
+        """
+        Add to a counter.
+
+        Args:
+            name (str): Metric name without prefix
+            value (float): Amount to add
+            help_text (str): Description shown in the export
+            **labels: Label values identifying the series
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series(name, 'counter', help_text)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, help_text='', buckets=STAGE_BUCKETS, **labels):
+        """
+        Record an observation in a histogram.
+
+        Args:
+            name (str): Metric name without prefix
+            value (float): Observed value
+            help_text (str): Description shown in the export
+            buckets (tuple): Bucket upper bounds (fixed on first use of the name)
+            **labels: Label values identifying the series
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series(name, 'histogram', help_text)
+            state = series.get(key)
+            if state is None:
+                state = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+                series[key] = state
+            for index, bound in enumerate(state["buckets"]):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def add_collector(self, collector):
+        """
+        Register a function called at export time for values owned by other components.
+
+        Args:
+            collector (callable): Returns a list of (name, type, help, [(labels dict, value)])
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """
+        Export all metrics.
+
+        Returns:
+            str: Prometheus text exposition format (version 0.0.4)
+        """
+        with self._lock:
+            metrics = [(name, metric_type, help_text, dict(series))
+                       for name, (metric_type, help_text, series) in sorted(self._metrics.items())]
+            histograms = {name: {key: dict(state, counts=list(state["counts"])) for key, state in series.items()}
+                          for name, metric_type, _, series in metrics if metric_type == 'histogram'}
+            collectors = list(self._collectors)
+
+        lines = []
+        for name, metric_type, help_text, series in metrics:
+            full_name = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            if metric_type == 'counter':
+                for key, value in sorted(series.items()):
+                    lines.append(f"{full_name}{_format_labels(key)} {_format_value(value)}")
+                continue
+
+            for key, state in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(state["buckets"], state["counts"]):
+                    cumulative += count
+                    lines.append(f"{full_name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{full_name}_bucket{_format_labels(key + (('le', '+Inf'),))} {state['count']}")
+                lines.append(f"{full_name}_sum{_format_labels(key)} {_format_value(state['sum'])}")
+                lines.append(f"{full_name}_count{_format_labels(key)} {state['count']}")
+
+        for collector in collectors:
+            try:
+                for name, metric_type, help_text, samples in collector():
+                    full_name = f"{METRIC_PREFIX}_{name}"
+                    lines.append(f"# HELP {full_name} {help_text}")
+                    lines.append(f"# TYPE {full_name} {metric_type}")
+                    for labels, value in samples:
+                        lines.append(f"{full_name}{_format_labels(tuple(sorted(labels.items())))} "
+                                     f"{_format_value(value)}")
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+
+        return "\n".join(lines) + "\n"
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry, creating it on first use"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = MetricsRegistry()
+        return _metrics
+
+
+def observe_stage(stage, seconds, **labels):
+    """
+    Record the duration of a pipeline stage.
+
+    Args:
+        stage (str): Stage name (see the STAGE_* constants; LLM calls use their own names)
+        seconds (float): Duration
+        **labels: Extra labels, e.g. model
+    """
+    get_metrics().observe('stage_duration_seconds', seconds,
+                          help_text="Duration of pipeline stages in seconds", stage=stage, **labels)
+
+
+@contextmanager
+def stage_timer(stage, **labels):
+    """
+    Time a block as a pipeline stage. Failed blocks are counted in stage_failures_total
+    instead of the duration histogram.
+
+    Args:
+        stage (str): Stage name
+        **labels: Extra labels
+    """
+    start_time = time.time()
+    try:
+        yield
+    except Exception:
+        get_metrics().inc('stage_failures_total', help_text="Pipeline stages that raised an error",
+                          stage=stage, **labels)
+        raise
+    observe_stage(stage, time.time() - start_time, **labels)
+
+
+def record_token_usage(stage, model, usage):
+    """
+    Count the tokens reported in an LLM response's usage block.
+
+    Args:
+        stage (str): Stage that made the call
+        model (str): Model name
+        usage: Usage object with prompt_tokens and completion_tokens (may be None)
+    """
+    if usage is None:
+        return
+    metrics = get_metrics()
+    for kind in ('prompt', 'completion'):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if tokens:
+            metrics.inc('llm_tokens_total', tokens, help_text="Tokens used by LLM calls",
+                        stage=stage, model=model, kind=kind)
@@ -0,0 +1,56 @@
+# ocr_cache.py
+import os
+import hashlib
+import threading
+
+from disk_cache import DiskCache
+
+# Mistral OCR model used throughout the backend; part of the cache key so a model
+# upgrade never serves text produced by the previous model
+OCR_MODEL = "mistral-ocr-latest"
+
+# OCR text is full patient document content: it is kept no longer than the uploads it
+# came from (UPLOAD_TTL in janitor.py)
+OCR_CACHE_TTL = float(os.environ.get('OCR_CACHE_TTL', 24 * 3600))
+
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+
+def ocr_cache_key(content_hash, model=OCR_MODEL):
+    """
+    Build the cache key for OCR output of a document.
+
+    Args:
+        content_hash (str): SHA-256 hex digest of the document bytes
+        model (str): OCR model name
+
+    Returns:
+        str: Cache key
+    """
+    return hashlib.sha256(f"{model}:{content_hash}".encode("utf-8")).hexdigest()
+
+
+def ocr_page_cache_key(page_hash, model=OCR_MODEL):
+    """
+    Build the cache key for OCR output of a single PDF page.
+
+    Args:
+        page_hash (str): Fingerprint of the page (see text_layer.page_fingerprint)
+        model (str): OCR model name
+
+    Returns:
+        str: Cache key
+    """
+    return hashlib.sha256(f"{model}:page:{page_hash}".encode("utf-8")).hexdigest()
+
+
+def get_ocr_cache():
+    """Return the process-wide OCR result cache, creating it on first use"""
+    global _ocr_cache
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            directory = os.environ.get('OCR_CACHE_DIR', './cache/ocr')
+            max_bytes = int(os.environ.get('OCR_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+            _ocr_cache = DiskCache(directory, max_bytes=max_bytes, ttl=OCR_CACHE_TTL)
+        return _ocr_cache
@@ -0,0 +1,385 @@
+# ocr_pipeline.py
+import os
+import logging
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from disk_cache import file_sha256
+from ocr_cache import OCR_MODEL, ocr_cache_key, ocr_page_cache_key, get_ocr_cache
+from text_layer import extract_text_layer, write_pdf_pages, page_fingerprint
+from file_info import sniff_file, KIND_PDF
+from metrics import observe_stage, STAGE_OCR, STAGE_MISTRAL_UPLOAD, STAGE_SIGNED_URL, STAGE_MISTRAL_OCR
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Separator placed between pages when page texts are joined into one document
+PAGE_SEPARATOR = "\n\f\n"
+
+# Pages sent to Mistral per OCR request, and how many requests run at once
+OCR_PAGES_PER_REQUEST = int(os.environ.get('OCR_PAGES_PER_REQUEST', 4))
+OCR_MAX_WORKERS = int(os.environ.get('OCR_MAX_WORKERS', 4))
+
+
+def ocr_document(mistral_client, file_path, file_name, progress=None, content_hash=None):
+    """
+    Get the text of a document as cheaply as possible.
+
+    Order of preference: the OCR cache, the PDF's embedded text layer, and only then
+    Mistral OCR - restricted to the pages that have no usable text layer.
+
+    Args:
+        mistral_client (Mistral): Mistral client
+        file_path (str): Path to the document on disk
+        file_name (str): Name to upload the document under
+        progress (callable, optional): progress(stage, **data) callback; receives an
+                                       'ocr_page' event as page ranges finish
+        content_hash (str, optional): SHA-256 of the file, if the caller already has it
+
+    Returns:
+        str: Extracted text (empty if nothing could be extracted)
+    """
+    start_time = time.time()
+
+    # Re-uploads of the same document are served from the OCR cache without touching Mistral
+    ocr_cache = get_ocr_cache()
+    content_hash = content_hash or file_sha256(file_path)
+    cache_key = ocr_cache_key(content_hash)
+    extracted_text = ocr_cache.get(cache_key)
+    if extracted_text is not None:
+        logger.info(f"OCR cache hit for {file_name}, skipping Mistral OCR")
+        observe_stage(STAGE_OCR, time.time() - start_time, source='cache')
+        return extracted_text
+
+    # Usually already sniffed while validating the upload
+    info = sniff_file(file_path, content_hash)
+    logger.info(f"Document is {info['kind']} with {info['pageCount']} pages")
+
+    page_texts, scanned_pages = None, None
+    if info['kind'] == KIND_PDF:
+        page_texts, scanned_pages = extract_text_layer(file_path)
+
+    if page_texts is None:
+        # Images, or PDFs we cannot split: OCR the document as a whole
+        source = 'mistral'
+        extracted_text = run_ocr(mistral_client, file_path, file_name)
+    elif not scanned_pages:
+        logger.info(f"Using embedded text layer for all {len(page_texts)} pages, skipping Mistral OCR")
+        source = 'text_layer'
+        extracted_text = PAGE_SEPARATOR.join(page_texts)
+    else:
+        source = 'mistral'
+        extracted_text = _ocr_pages(mistral_client, file_path, file_name, page_texts, scanned_pages, progress)
+
+    observe_stage(STAGE_OCR, time.time() - start_time, source=source)
+    if extracted_text:
+        ocr_cache.set(cache_key, extracted_text)
+    return extracted_text
+
+
+def _ocr_pages(mistral_client, file_path, file_name, page_texts, scanned_pages, progress=None):
+    """
+    OCR the scanned pages of a PDF and splice the results into the text layer.
+
+    Pages already OCR'd in an earlier upload are taken from the page cache; the rest
+    are split into small page ranges that are OCR'd concurrently, so latency follows
+    the slowest range rather than the length of the document.
+
+    Args:
+        mistral_client (Mistral): Mistral client
+        file_path (str): Path to the PDF
+        file_name (str): Name of the original upload
+        page_texts (list): Text layer of every page
+        scanned_pages (list): Indexes of pages that need OCR
+        progress (callable, optional): progress(stage, **data) callback
+
+    Returns:
+        str: Text of the whole document in page order
+    """
+    from PyPDF2 import PdfReader
+
+    ocr_cache = get_ocr_cache()
+    pages = list(page_texts)
+
+    try:
+        with open(file_path, "rb") as f:
+            reader = PdfReader(f)
+            page_keys = {page_num: ocr_page_cache_key(page_fingerprint(reader.pages[page_num]))
+                         for page_num in scanned_pages}
+    except Exception as e:
+        logger.warning(f"Could not split PDF into pages, OCR-ing the whole document: {str(e)}")
+        return run_ocr(mistral_client, file_path, file_name)
+
+    missing_pages = []
+    for page_num in scanned_pages:
+        cached_text = ocr_cache.get(page_keys[page_num])
+        if cached_text is not None:
+            pages[page_num] = cached_text
+        else:
+            missing_pages.append(page_num)
+
+    logger.info(f"{len(scanned_pages)}/{len(page_texts)} pages need OCR, "
+                f"{len(scanned_pages) - len(missing_pages)} served from the page cache")
+
+    total_pages = len(page_texts)
+    pages_done = total_pages - len(missing_pages)
+    if progress:
+        progress('ocr_page', pagesDone=pages_done, totalPages=total_pages)
+
+    if missing_pages:
+        batches = [missing_pages[i:i + OCR_PAGES_PER_REQUEST]
+                   for i in range(0, len(missing_pages), OCR_PAGES_PER_REQUEST)]
+
+        with ThreadPoolExecutor(max_workers=min(OCR_MAX_WORKERS, len(batches)),
+                                thread_name_prefix="ocr-page") as executor:
+            futures = {
+                executor.submit(_ocr_page_batch, mistral_client, file_path, file_name, batch): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                batch_texts, per_page = future.result()
+                for page_num, text in zip(batch, batch_texts):
+                    pages[page_num] = text
+                    # Only cache text we could attribute to an individual page
+                    if per_page and text:
+                        ocr_cache.set(page_keys[page_num], text)
+
+                pages_done += len(batch)
+                if progress:
+                    progress('ocr_page', pagesDone=pages_done, totalPages=total_pages)
+
+    return PAGE_SEPARATOR.join(pages)
+
+
+def _ocr_page_batch(mistral_client, file_path, file_name, batch):
+    """
+    OCR a range of pages of a PDF.
+
+    Args:
+        mistral_client (Mistral): Mistral client
+        file_path (str): Path to the PDF
+        file_name (str): Name of the original upload
+        batch (list): Page indexes to OCR
+
+    Returns:
+        tuple: (texts, per_page) with one text per page in batch; per_page is False when
+               the response could not be split by page and all text sits in the first slot
+    """
+    fd, subset_path = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
+    try:
+        write_pdf_pages(file_path, batch, subset_path)
+        ocr_response = request_ocr(mistral_client, subset_path, f"pages_{batch[0] + 1}-{batch[-1] + 1}_{file_name}")
+    finally:
+        try:
+            os.unlink(subset_path)
+        except OSError:
+            pass
+
+    ocr_pages = page_texts_from_ocr_response(ocr_response)
+    if ocr_pages is not None and len(ocr_pages) == len(batch):
+        return ocr_pages, True
+
+    logger.warning(f"OCR response for pages {batch} is not split by page, keeping text at page {batch[0]}")
+    return [text_from_ocr_response(ocr_response)] + [""] * (len(batch) - 1), False
+
+
+def run_ocr(mistral_client, file_path, file_name):
+    """
+    Upload a file to Mistral and run OCR on it, retrying with exponential backoff.
+
+    Args:
+        mistral_client (Mistral): Mistral client
+        file_path (str): Path to the file
+        file_name (str): Name to upload the file under
+
+    Returns:
+        str: Extracted text (empty if nothing could be extracted)
+    """
+    ocr_response = request_ocr(mistral_client, file_path, file_name)
+    return text_from_ocr_response(ocr_response)
+
+
+def request_ocr(mistral_client, file_path, file_name):
+    """
+    Upload a file to Mistral and run OCR on it, retrying the OCR call with exponential backoff.
+
+    Args:
+        mistral_client (Mistral): Mistral client
+        file_path (str): Path to the file
+        file_name (str): Name to upload the file under
+
+    Returns:
+        Mistral OCR response object
+    """
+    # Upload to Mistral for OCR processing, streaming from a single file handle
+    logger.info(f"Uploading file to Mistral ({os.path.getsize(file_path)} bytes)...")
+    start_upload = time.time()
+    with open(file_path, "rb") as f:
+        uploaded_file = mistral_client.files.upload(
+            file={
+                "file_name": file_name,
+                "content": f,
+            },
+            purpose="ocr"
+        )
+    upload_time = time.time() - start_upload
+    observe_stage(STAGE_MISTRAL_UPLOAD, upload_time)
+    logger.info(f"File uploaded to Mistral with ID: {uploaded_file.id} in {upload_time:.2f} seconds")
+
+    # Get signed URL for the uploaded file
+    logger.info("Getting signed URL...")
+    start_url = time.time()
+    signed_url = mistral_client.files.get_signed_url(file_id=uploaded_file.id)
+    url_time = time.time() - start_url
+    observe_stage(STAGE_SIGNED_URL, url_time)
+    logger.info(f"Signed URL obtained successfully in {url_time:.2f} seconds. URL length: {len(signed_url.url)} characters")
+
+    # Enhanced OCR processing with timeouts
+    logger.info("Processing OCR with enhanced timeout handling...")
+    max_attempts = 3
+    attempt = 0
+    backoff_factor = 2  # For exponential backoff
+
+    while True:
+        try:
+            attempt += 1
+            logger.info(f"OCR processing attempt {attempt}/{max_attempts}...")
+
+            # Add timing information
+            start_time = time.time()
+            logger.info(f"Starting OCR request at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+
+            ocr_response = mistral_client.ocr.process(
+                model=OCR_MODEL,
+                document={
+                    "type": "document_url",
+                    "document_url": signed_url.url,
+                }
+            )
+
+            elapsed_time = time.time() - start_time
+            observe_stage(STAGE_MISTRAL_OCR, elapsed_time)
+            logger.info(f"OCR request completed in {elapsed_time:.2f} seconds")
+            logger.info(f"OCR processing completed successfully on attempt {attempt}")
+            return ocr_response
+
+        except Exception as e:
+            logger.error(f"OCR processing attempt {attempt} failed with error: {str(e)}")
+            logger.error(f"Error type: {type(e).__name__}")
+            logger.error(traceback.format_exc())
+
+            if attempt >= max_attempts:
+                logger.error(f"All {max_attempts} OCR processing attempts failed")
+                raise Exception(f"OCR processing failed after {max_attempts} attempts: {str(e)}")
+
+            # Calculate wait time with exponential backoff (2^attempt seconds)
+            wait_time = backoff_factor ** attempt
+            logger.info(f"Waiting {wait_time} seconds before retry...")
+            time.sleep(wait_time)
+
+
+def _ocr_response_to_dict(ocr_response):
+    """Convert an OCR response object to a dictionary, or None if that is not possible"""
+    if hasattr(ocr_response, 'model_dump'):
+        return ocr_response.model_dump()
+    elif hasattr(ocr_response, 'dict'):
+        return ocr_response.dict()
+    elif hasattr(ocr_response, '__dict__'):
+        return ocr_response.__dict__
+    return None
+
+
+def page_texts_from_ocr_response(ocr_response):
+    """
+    Extract the text of each page from a Mistral OCR response.
+
+    Args:
+        ocr_response: Mistral OCR response object
+
+    Returns:
+        list: One string per page in page order, or None if the response has no pages
+    """
+    try:
+        response_dict = _ocr_response_to_dict(ocr_response)
+    except Exception as e:
+        logger.error(f"Error converting OCR response to dictionary: {str(e)}")
+        return None
+
+    if not response_dict or not isinstance(response_dict.get('pages'), list):
+        return None
+
+    pages = sorted(
+        (page for page in response_dict['pages'] if isinstance(page, dict)),
+        key=lambda page: page.get('index', 0)
+    )
+    # Mistral returns page content as markdown; other OCR APIs use plain text
+    return [page.get('markdown') or page.get('text') or "" for page in pages]
+
+
+def text_from_ocr_response(ocr_response):
+    """
+    Extract text content from an OCR response, trying several response shapes.
+
+    Args:
+        ocr_response: Mistral OCR response object
+
+    Returns:
+        str: Extracted text
+    """
+    extracted_text = ""
+
+    # Extract text content from OCR response - robust approach
+    try:
+        response_dict = _ocr_response_to_dict(ocr_response)
+        if response_dict is None:
+            logger.warning("Could not convert OCR response to dictionary")
+
+        # Debug the response structure
+        logger.debug(f"OCR response type: {type(ocr_response)}")
+        if response_dict:
+            logger.debug(f"OCR response keys: {list(response_dict.keys())}")
+
+        # Try different approaches to extract text
+        if response_dict:
+            if 'content' in response_dict:
+                extracted_text = response_dict['content']
+                logger.info(f"Found content field with {len(extracted_text)} characters")
+            elif 'data' in response_dict:
+                extracted_text = response_dict['data']
+                logger.info(f"Found data field with {len(extracted_text)} characters")
+            elif 'pages' in response_dict:
+                # Some OCR APIs return text by pages
+                pages_text = page_texts_from_ocr_response(ocr_response) or []
+                extracted_text = PAGE_SEPARATOR.join(pages_text)
+                logger.info(f"Found pages field with {len(extracted_text)} characters across {len(pages_text)} pages")
+
+        # Try direct attribute access
+        if not extracted_text:
+            if hasattr(ocr_response, 'content'):
+                extracted_text = ocr_response.content
+                logger.info("Extracted text from content attribute")
+            elif hasattr(ocr_response, 'text'):
+                extracted_text = ocr_response.text
+                logger.info("Extracted text from text attribute")
+            elif hasattr(ocr_response, 'data'):
+                extracted_text = ocr_response.data
+                logger.info("Extracted text from data attribute")
+
+    except Exception as e:
+        logger.error(f"Error extracting text from OCR response structure: {str(e)}")
+        logger.error(traceback.format_exc())
+        # Don't give up yet
+
+    # If still no text, try converting the whole response to string
+    if not extracted_text:
+        try:
+            extracted_text = str(ocr_response)
+            logger.warning("Extracted text by converting entire response to string")
+        except Exception as e:
+            logger.error(f"Failed to extract text by string conversion: {str(e)}")
+
+    return extracted_text
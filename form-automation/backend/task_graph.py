@@ -0,0 +1,109 @@
+# task_graph.py
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class TaskGraph:
+    """
+    Minimal DAG executor. Each task starts on a thread pool as soon as all of the
+    tasks it depends on have finished, and receives their results as keyword arguments.
+
+    Example:
+        graph = TaskGraph()
+        graph.add('a', lambda: 1)
+        graph.add('b', lambda a: a + 1, depends_on=['a'])
+        results = graph.run()  # {'a': 1, 'b': 2}
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def add(self, name, func, depends_on=()):
+        """
+        Register a task.
+
+        Args:
+            name (str): Unique task name; also the keyword its result is passed under
+            func (callable): Function called with the results of its dependencies
+            depends_on (iterable): Names of tasks that must finish first
+        """
+        if name in self._tasks:
+            raise ValueError(f"Task already registered: {name}")
+        self._tasks[name] = (func, tuple(depends_on))
+
+    def _check(self):
+        for name, (_, deps) in self._tasks.items():
+            for dep in deps:
+                if dep not in self._tasks:
+                    raise ValueError(f"Task '{name}' depends on unknown task '{dep}'")
+
+        # Detect cycles with a depth-first walk
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle detected at task '{name}'")
+            visiting.add(name)
+            for dep in self._tasks[name][1]:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self._tasks:
+            visit(name)
+
+    def run(self, max_workers=None, on_task_done=None):
+        """
+        Execute all tasks, respecting dependencies.
+
+        Args:
+            max_workers (int, optional): Thread pool size (defaults to the number of tasks)
+            on_task_done (callable, optional): Called as on_task_done(name, result, seconds)
+                                               as each task finishes
+
+        Returns:
+            dict: Task name -> result
+
+        Raises:
+            Exception: The first exception raised by any task; tasks not yet started are skipped
+        """
+        self._check()
+
+        results = {}
+        pending = dict(self._tasks)
+        running = {}
+        start_times = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers or max(len(self._tasks), 1),
+                                thread_name_prefix="task-graph") as executor:
+            while pending or running:
+                # Start every task whose dependencies are satisfied
+                for name, (func, deps) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        kwargs = {dep: results[dep] for dep in deps}
+                        start_times[name] = time.time()
+                        running[executor.submit(func, **kwargs)] = name
+                        del pending[name]
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        logger.error(f"Task '{name}' failed: {str(error)}")
+                        for other in running:
+                            other.cancel()
+                        raise error
+                    results[name] = future.result()
+                    seconds = time.time() - start_times[name]
+                    logger.info(f"Task '{name}' finished in {seconds:.2f} seconds")
+                    if on_task_done:
+                        on_task_done(name, results[name], seconds)
+
+        return results
@@ -0,0 +1,95 @@
+# template_registry.py
+import io
+import os
+import logging
+import threading
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class TemplateRegistry:
+    """
+    Parses each PDF form template once and keeps it in memory.
+
+    The template is read fully into memory (no file handle stays open) and re-parsed
+    only when its modification time changes. Fills never modify the cached pages:
+    overlays are merged onto a shallow copy of the page dictionary, which shares the
+    template's content and resource objects, and the copy is added to the caller's
+    PdfWriter.
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def _load(self, template_path):
+        """Return the cached (mtime, reader, lock) entry for a template, re-parsing it if it changed"""
+        if not os.path.exists(template_path):
+            logger.error(f"Template file not found: {template_path}")
+            raise FileNotFoundError(f"Template file not found: {template_path}")
+
+        mtime = os.path.getmtime(template_path)
+        with self._lock:
+            entry = self._templates.get(template_path)
+            if entry is not None and entry[0] == mtime:
+                return entry
+
+            from PyPDF2 import PdfReader
+
+            with open(template_path, "rb") as f:
+                data = f.read()
+            reader = PdfReader(io.BytesIO(data))
+            entry = (mtime, reader, threading.Lock())
+            self._templates[template_path] = entry
+            logger.info(f"Parsed template {template_path} ({len(reader.pages)} pages)")
+            return entry
+
+    def page_count(self, template_path):
+        """
+        Args:
+            template_path (str): Path to the template PDF
+
+        Returns:
+            int: Number of pages in the template
+        """
+        _, reader, _ = self._load(template_path)
+        return len(reader.pages)
+
+    def fill_into(self, template_path, writer, overlays):
+        """
+        Append all template pages to a writer, merging an overlay onto selected pages.
+
+        Args:
+            template_path (str): Path to the template PDF
+            writer (PdfWriter): Writer receiving the pages
+            overlays (dict): Page index -> overlay PageObject; pages without an entry
+                             are added unchanged
+        """
+        from PyPDF2 import PageObject
+
+        _, reader, lock = self._load(template_path)
+        # The reader resolves objects lazily from a shared stream, so fills are serialized
+        with lock:
+            for page_num, page in enumerate(reader.pages):
+                overlay = overlays.get(page_num)
+                if overlay is not None:
+                    # Merging replaces /Contents and /Resources on the copy only
+                    copy = PageObject(pdf=page.pdf)
+                    copy.update(page)
+                    copy.merge_page(overlay)
+                    page = copy
+                writer.add_page(page)
+
+
+_template_registry = None
+_template_registry_lock = threading.Lock()
+
+
+def get_template_registry():
+    """Return the process-wide template registry, creating it on first use"""
+    global _template_registry
+    with _template_registry_lock:
+        if _template_registry is None:
+            _template_registry = TemplateRegistry()
+        return _template_registry
@@ -0,0 +1,9 @@
+# conftest.py
+import os
+import sys
+
+# Tests import the backend modules the way app.py does, from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the background janitor from sweeping the checked-in sample uploads
+os.environ.setdefault('JANITOR_ENABLED', 'false')
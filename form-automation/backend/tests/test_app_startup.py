@@ -0,0 +1,52 @@
+# test_app_startup.py
+import os
+import runpy
+import logging
+
+import janitor
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+class RecordingJanitor:
+    def __init__(self):
+        self.started = False
+        self.tasks = []
+        self.in_use = None
+
+    def add_task(self, task):
+        self.tasks.append(task)
+
+    def set_in_use(self, in_use):
+        self.in_use = in_use
+
+    def start(self):
+        self.started = True
+
+    def collect_metrics(self):
+        return []
+
+
+def _run_app(monkeypatch, run_name):
+    recording = RecordingJanitor()
+    monkeypatch.setenv('JANITOR_ENABLED', 'true')
+    monkeypatch.setattr(janitor, 'get_janitor', lambda *args: recording)
+    configured = []
+    monkeypatch.setattr(logging, 'basicConfig', lambda **kwargs: configured.append(kwargs))
+    runpy.run_path(APP_PATH, run_name=run_name)
+    return recording, configured
+
+
+def test_render_worker_reimport_has_no_side_effects(monkeypatch):
+    recording, configured = _run_app(monkeypatch, '__mp_main__')
+    assert not recording.started
+    assert recording.tasks == []
+    assert configured == []
+
+
+def test_server_import_starts_background_services(monkeypatch):
+    recording, configured = _run_app(monkeypatch, 'app')
+    assert recording.started
+    assert len(recording.tasks) == 3
+    assert recording.in_use is not None
+    assert len(configured) == 1
@@ -0,0 +1,58 @@
+# test_disk_cache.py
+import os
+import time
+
+import ocr_cache
+from disk_cache import DiskCache, CACHE_EVICT_LOW_WATER
+
+
+def test_purge_expired_deletes_entries_by_age_not_last_use(tmp_path):
+    cache = DiskCache(str(tmp_path), ttl=3600)
+    cache.set("aa01", {"text": "old page"})
+    stored = time.time()
+    os.utime(cache._path("aa01"), (stored - 7200, stored - 7200))
+    cache.set("bb02", {"text": "new page"})
+    # A hit marks the entry as used without making it younger
+    assert cache.get("bb02") == {"text": "new page"}
+
+    assert cache.purge_expired() == 1
+    assert not os.path.exists(cache._path("aa01"))
+    assert cache.get("bb02") == {"text": "new page"}
+
+    assert cache.purge_expired(now=time.time() + 3601) == 1
+    assert cache._total_bytes == 0
+
+
+def test_purge_without_ttl_keeps_everything(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.set("aa01", "value")
+
+    assert cache.purge_expired(now=time.time() + 10 ** 9) == 0
+    assert cache.get("aa01") == "value"
+
+
+def test_ocr_cache_expires_entries(tmp_path, monkeypatch):
+    monkeypatch.setenv('OCR_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(ocr_cache, '_ocr_cache', None)
+
+    assert ocr_cache.get_ocr_cache().ttl == ocr_cache.OCR_CACHE_TTL
+
+
+def test_eviction_frees_space_below_the_size_bound(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path))
+    cache.set("00aa", "x" * 60)
+    entry_size = cache._total_bytes
+    cache.max_bytes = 10.5 * entry_size
+    for index in range(1, 10):
+        cache.set(f"{index:02d}aa", "x" * 60)
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, '_scan', lambda: scans.append(1) or scan())
+
+    cache.set("10aa", "x" * 60)
+    assert len(scans) == 1
+    assert cache._total_bytes <= cache.max_bytes * CACHE_EVICT_LOW_WATER
+
+    # The freed space takes the next write without another scan
+    cache.set("11aa", "x" * 60)
+    assert len(scans) == 1
@@ -0,0 +1,27 @@
+# test_download_cache.py
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'DOWNLOAD_FOLDER', str(tmp_path))
+    return app_module.app.test_client()
+
+
+def test_generated_forms_are_cached_as_immutable(client, tmp_path):
+    response = client.post('/api/generate-forms', json={"formData": {"ibhs": {"recipient_name": "Amy Smith"}}})
+    assert response.status_code == 200
+    links = response.json["downloadLinks"]
+    assert links
+
+    for link in links.values():
+        download = client.get(link)
+        assert download.status_code == 200
+        assert download.headers['Cache-Control'] == f"public, max-age={app_module.DOWNLOAD_MAX_AGE}, immutable"
+
+
+def test_other_files_must_be_revalidated(client, tmp_path):
+    (tmp_path / 'report.pdf').write_bytes(b'%PDF-1.4\n')
+    assert client.get('/download/report.pdf').headers['Cache-Control'] == "no-cache"
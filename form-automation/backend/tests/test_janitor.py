@@ -0,0 +1,41 @@
+# test_janitor.py
+import os
+import time
+
+from janitor import DirectoryJanitor, Janitor
+
+
+def _write(path, size, age):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+
+
+def test_size_cap_skips_files_in_use(tmp_path):
+    queued = tmp_path / 'queued.pdf'
+    idle = tmp_path / 'idle.pdf'
+    # The queued upload is the least recently used file, so it would be evicted first
+    _write(queued, 1000, age=3000)
+    _write(idle, 1000, age=2000)
+
+    janitor = Janitor([DirectoryJanitor(str(tmp_path), max_bytes=1500, min_age=600)])
+    janitor.set_in_use(lambda: {os.path.abspath(str(queued))})
+    janitor.sweep()
+
+    assert queued.exists()
+    assert not idle.exists()
+
+
+def test_nothing_is_swept_when_files_in_use_are_unknown(tmp_path):
+    old = tmp_path / 'old.pdf'
+    _write(old, 1000, age=3000)
+
+    def broken():
+        raise RuntimeError("job store unavailable")
+
+    janitor = Janitor([DirectoryJanitor(str(tmp_path), ttl=60, max_bytes=10, min_age=0)])
+    janitor.set_in_use(broken)
+    janitor.sweep()
+
+    assert old.exists()
@@ -0,0 +1,54 @@
+# test_job_events.py
+import threading
+
+import pytest
+
+import app as app_module
+from job_queue import JobQueue, InMemoryJobStore
+
+
+@pytest.fixture
+def job_queue(monkeypatch):
+    queue = JobQueue(InMemoryJobStore(), max_workers=1)
+    monkeypatch.setattr(app_module, 'get_job_queue', lambda: queue)
+    return queue
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def test_poll_returns_events_after_sequence(job_queue, client):
+    job_id = job_queue.create('upload')
+    job_queue.publish(job_id, 'saved')
+    job_queue.publish(job_id, 'ocr_done', extractedText="Patient Name: Amy Smith")
+
+    response = client.get(f'/api/jobs/{job_id}/events?after=1')
+    assert response.status_code == 200
+    assert [event['stage'] for event in response.json['events']] == ['ocr_done']
+    assert response.json['events'][0]['seq'] == 2
+
+    assert client.get('/api/jobs/unknown/events').status_code == 404
+    assert client.get(f'/api/jobs/{job_id}/events?after=x').status_code == 400
+    assert client.get(f'/api/jobs/{job_id}/events?after=-2').status_code == 400
+
+
+def test_stream_closes_after_cap_while_job_runs(job_queue, client, monkeypatch):
+    monkeypatch.setattr(app_module, 'EVENT_STREAM_MAX_SECONDS', 0.2)
+    monkeypatch.setattr(app_module, 'EVENT_POLL_INTERVAL', 0.05)
+    job_id = job_queue.create('upload')
+    job_queue.publish(job_id, 'saved')
+
+    finished = threading.Event()
+
+    def read_stream():
+        body = client.get(f'/api/upload/{job_id}/events').get_data(as_text=True)
+        assert body.startswith('retry: ')
+        assert 'event: saved' in body
+        finished.set()
+
+    reader = threading.Thread(target=read_stream)
+    reader.start()
+    reader.join(timeout=5)
+    assert finished.is_set()
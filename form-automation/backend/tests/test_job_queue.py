@@ -0,0 +1,62 @@
+# test_job_queue.py
+import time
+
+import pytest
+
+from job_queue import InMemoryJobStore, SQLiteJobStore, JobQueue, JOB_SUCCEEDED
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'sqlite':
+        return SQLiteJobStore(str(tmp_path / 'jobs.db'))
+    return InMemoryJobStore()
+
+
+def _finished_job(store, job_id, finished_at):
+    store.create({"id": job_id, "status": JOB_SUCCEEDED, "createdAt": finished_at - 1,
+                  "finishedAt": finished_at, "result": {"patientData": {"name": "Amy Smith"}}})
+    store.add_event(job_id, {"stage": JOB_SUCCEEDED})
+
+
+def test_purge_removes_only_expired_finished_jobs(store):
+    now = time.time()
+    _finished_job(store, 'old', now - 7200)
+    _finished_job(store, 'recent', now - 60)
+    store.create({"id": 'running', "status": 'running', "createdAt": now - 7200, "finishedAt": None})
+
+    queue = JobQueue(store, max_workers=1, retention=3600)
+    assert queue.purge_expired(now) == 1
+
+    assert store.get('old') is None
+    assert store.get_events('old') == []
+    assert store.get('recent') is not None
+    assert store.get('running') is not None
+
+
+def test_zero_retention_keeps_jobs(store):
+    _finished_job(store, 'old', time.time() - 7200)
+    assert JobQueue(store, max_workers=1, retention=0).purge_expired() == 0
+    assert store.get('old') is not None
+
+
+def test_active_files_cover_queued_and_running_jobs(store, tmp_path):
+    queue = JobQueue(store, max_workers=1)
+    queue.create('upload', files=[str(tmp_path / 'queued.pdf')])
+    running = queue.create('upload', files=[str(tmp_path / 'running.pdf')])
+    done = queue.create('upload', files=[str(tmp_path / 'done.pdf')])
+    store.update(running, status='running')
+    store.update(done, status=JOB_SUCCEEDED, finishedAt=time.time())
+
+    assert queue.active_files() == {str(tmp_path / 'queued.pdf'), str(tmp_path / 'running.pdf')}
+
+
+def test_events_after_sequence_agree_across_stores(store):
+    queue = JobQueue(store, max_workers=1)
+    job_id = queue.create('upload')
+    for stage in ('saved', 'validated', 'ocr_done'):
+        queue.publish(job_id, stage)
+
+    assert [event['seq'] for event in queue.get_events(job_id, 1)] == [2, 3]
+    assert [event['seq'] for event in queue.get_events(job_id, 3)] == []
+    assert [event['seq'] for event in queue.get_events(job_id, -2)] == [1, 2, 3]
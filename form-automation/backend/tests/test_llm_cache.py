@@ -0,0 +1,63 @@
+# test_llm_cache.py
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+from disk_cache import DiskCache
+
+JSON_FORMAT = {"type": "json_object"}
+
+
+class FakeOpenAI:
+    """Chat client returning queued (content, finish_reason) replies"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **request):
+        self.calls += 1
+        content, finish_reason = self.replies.pop(0)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason)],
+            usage=None)
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / 'llm'), max_bytes=1024 * 1024, ttl=3600)
+    monkeypatch.setattr(llm_cache, 'get_llm_cache', lambda: cache)
+    return cache
+
+
+def _complete(client, response_format=JSON_FORMAT):
+    return llm_cache.cached_chat_completion(client, model="gpt-4o", messages=[{"role": "user", "content": "hi"}],
+                                            temperature=0.1, response_format=response_format)
+
+
+@pytest.mark.parametrize("reply", [
+    ('{"name": "Amy', "length"),
+    ('{"name": "Amy', "stop"),
+    ('', "stop"),
+])
+def test_incomplete_replies_are_not_cached(reply):
+    client = FakeOpenAI([reply, ('{"name": "Amy"}', "stop")])
+    assert _complete(client) == reply[0]
+    assert json.loads(_complete(client)) == {"name": "Amy"}
+    assert client.calls == 2
+
+
+def test_complete_reply_is_cached():
+    client = FakeOpenAI([('{"name": "Amy"}', "stop")])
+    assert _complete(client) == _complete(client)
+    assert client.calls == 1
+
+
+def test_text_replies_need_no_json():
+    client = FakeOpenAI([("plain text", "stop")])
+    _complete(client, response_format=None)
+    assert _complete(client, response_format=None) == "plain text"
+    assert client.calls == 1
@@ -0,0 +1,23 @@
+# test_merge_patient_records.py
+from utils import merge_patient_records
+
+
+def test_primary_diagnosis_stays_first():
+    merged = merge_patient_records([
+        {"diagnoses": [{"name": "ADHD", "code": "F90.0"}, {"name": "Anxiety", "code": "F41.1"}]},
+        {"diagnoses": [{"name": "Anxiety disorder", "code": "F41.1"}, {"name": "Autism", "code": "F84.0"}]}
+    ])
+    assert [diagnosis["code"] for diagnosis in merged["diagnoses"]] == ["F90.0", "F41.1", "F84.0"]
+
+
+def test_symptoms_keep_document_order():
+    merged = merge_patient_records([
+        {"symptoms": ["Tantrums", "poor sleep"]},
+        {"symptoms": ["aggression", "tantrums"]}
+    ])
+    assert merged["symptoms"] == ["Tantrums", "poor sleep", "aggression"]
+
+
+def test_scalar_conflicts_do_not_depend_on_order():
+    records = [{"name": "Amy Smith"}, {"name": "Amy Smith"}, {"name": "A. Smith"}]
+    assert merge_patient_records(records)["name"] == merge_patient_records(records[::-1])["name"] == "Amy Smith"
@@ -0,0 +1,47 @@
+# test_patient_documents.py
+import pytest
+
+import upload_pipeline
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Stub the OCR and LLM stages; OCR of 'corrupt.pdf' fails"""
+    def fake_ocr(client, file_path, unique_filename, content_hash=None):
+        if file_path == 'corrupt.pdf':
+            raise ValueError("PDF is damaged")
+        return f"Patient Name: Amy Smith ({file_path})"
+
+    monkeypatch.setattr(upload_pipeline, 'get_mistral_client', lambda key: None)
+    monkeypatch.setattr(upload_pipeline, 'get_openai_client', lambda key: None)
+    monkeypatch.setattr(upload_pipeline, 'ocr_document', fake_ocr)
+    monkeypatch.setattr(upload_pipeline, 'extract_clinical_data',
+                        lambda client, text, bypass_cache=False: {"diagnoses": [], "symptoms": [text]})
+    monkeypatch.setattr(upload_pipeline, 'extract_patient_data',
+                        lambda client, text, bypass_cache=False: {"name": "Amy Smith"})
+    monkeypatch.setattr(upload_pipeline, 'generate_measurable_goals', lambda client, data, bypass_cache=False: [])
+    monkeypatch.setattr(upload_pipeline, 'map_to_forms', lambda client, data, goals, bypass_cache=False: {})
+
+
+def _files(*paths):
+    return [{"fileName": path, "filePath": path, "uniqueFilename": path, "contentHash": path} for path in paths]
+
+
+def test_failed_document_is_reported_and_left_out_of_the_merge(pipeline):
+    progress = []
+    result = upload_pipeline.process_patient_documents(
+        _files('intake.pdf', 'corrupt.pdf', 'eval.pdf'), 'mistral', 'openai',
+        progress=lambda stage, **data: progress.append((stage, data)))
+
+    assert result["patientData"]["name"] == "Amy Smith"
+    assert [document["fileName"] for document in result["documents"]] == ['intake.pdf', 'corrupt.pdf', 'eval.pdf']
+    assert result["documents"][1] == {"fileName": 'corrupt.pdf', "contentHash": 'corrupt.pdf',
+                                      "error": "Processing error: PDF is damaged"}
+    assert "corrupt.pdf" not in result["extractedText"]
+    assert sorted(data["status"] for stage, data in progress if stage == 'document_done') == \
+        ['error', 'success', 'success']
+
+
+def test_job_fails_when_no_document_succeeds(pipeline):
+    with pytest.raises(ValueError, match="PDF is damaged"):
+        upload_pipeline.process_patient_documents(_files('corrupt.pdf'), 'mistral', 'openai')
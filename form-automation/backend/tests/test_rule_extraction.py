@@ -0,0 +1,113 @@
+# test_rule_extraction.py
+import json
+import os
+
+import pytest
+
+import upload_pipeline
+from data_extraction import score_rule_based_fields, low_confidence_fields
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+EHR_HEADER = ("Patient Name: Amy Smith DOB: 01/02/2016 Gender: Female "
+              "Guardian: Jane Smith (Mother) Phone: 555-1234")
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    """Record patient extraction prompts and answer them with fixed JSON"""
+    calls = []
+
+    def fake_completion(client, messages, **kwargs):
+        calls.append(messages[-1]["content"])
+        return json.dumps({"name": "LLM Name", "dob": "03/04/2015", "gender": "Male",
+                           "guardian_name": "LLM Guardian", "guardian_relationship": "Father",
+                           "age": "9"})
+
+    monkeypatch.setattr(upload_pipeline, "cached_chat_completion", fake_completion)
+    return calls
+
+
+def test_one_line_header_stops_each_value_at_the_next_label():
+    fields = score_rule_based_fields(EHR_HEADER)
+
+    assert fields["name"]["value"] == "Amy Smith"
+    assert fields["dob"]["value"] == "01/02/2016"
+    assert fields["guardian"]["value"] == "Jane Smith"
+    assert fields["gender"]["value"] == "Female"
+    assert fields["guardian_relationship"]["value"] == "Mother"
+    assert low_confidence_fields(fields, upload_pipeline.REQUIRED_PATIENT_FIELDS) == []
+
+
+def test_guardian_is_cut_before_the_phone_label():
+    fields = score_rule_based_fields("Parent: Jane Smith Phone: 555-1234")
+
+    assert fields["guardian"]["value"] == "Jane Smith"
+    assert low_confidence_fields(fields, ["guardian"]) == []
+
+
+def test_value_ending_in_a_label_word_is_low_confidence():
+    fields = score_rule_based_fields("Parent: Jane Smith Phone 555-1234")
+
+    assert low_confidence_fields(fields, ["guardian"]) == ["guardian"]
+
+
+def test_relationship_label_and_sex_abbreviation():
+    fields = score_rule_based_fields("Guardian: Bo Lee Relationship to Patient: Father Sex: F")
+
+    assert fields["guardian"]["value"] == "Bo Lee"
+    assert fields["guardian_relationship"]["value"] == "Father"
+    assert fields["gender"]["value"] == "Female"
+
+
+def test_confident_header_skips_the_llm(llm_calls):
+    patient = upload_pipeline.extract_patient_data(None, EHR_HEADER)
+
+    assert llm_calls == []
+    assert patient["name"] == "Amy Smith"
+    assert patient["guardian_name"] == "Jane Smith"
+    assert patient["gender"] == "Female"
+    assert patient["guardian_relationship"] == "Mother"
+
+
+def test_narrowed_prompt_always_asks_for_gender_and_relationship(llm_calls):
+    patient = upload_pipeline.extract_patient_data(
+        None, "Patient Name: Amy Smith DOB: 01/02/2016 Guardian: Jane Smith Phone: 555-1234")
+
+    assert len(llm_calls) == 1
+    assert "- gender:" in llm_calls[0]
+    assert "- guardian_relationship:" in llm_calls[0]
+    assert "- name:" not in llm_calls[0]
+    # Confident rule values are kept, the gaps come from the LLM
+    assert patient["name"] == "Amy Smith"
+    assert patient["guardian_name"] == "Jane Smith"
+    assert patient["gender"] == "Male"
+    assert patient["guardian_relationship"] == "Father"
+
+
+def test_sample_ehr_export_skips_the_llm(llm_calls):
+    # Text of uploads/*_amy_smith_ehr_record_cleaned.pdf, pages joined as the OCR step does
+    with open(os.path.join(DATA_DIR, "amy_smith_ehr_record.txt"), encoding="utf-8") as handle:
+        text = handle.read()
+
+    patient = upload_pipeline.extract_patient_data(None, text)
+
+    assert llm_calls == []
+    assert patient["name"] == "Amy Smith"
+    assert patient["dob"] == "05/15/2018"
+    assert patient["gender"] == "Female"
+    assert patient["guardian_name"] == "Jane Smith"
+    assert patient["guardian_relationship"] == "Mother"
+
+
+def test_bare_name_is_only_trusted_under_a_patient_heading():
+    under_heading = score_rule_based_fields("1. Patient Information\nName: Amy Smith\n")
+    elsewhere = score_rule_based_fields("4. Clinical Assessment\nName: John Doe\n")
+
+    assert low_confidence_fields(under_heading, ["name"]) == []
+    assert low_confidence_fields(elsewhere, ["name"]) == ["name"]
+
+
+def test_iso_dob_after_dob_label_is_written_as_us_date():
+    fields = score_rule_based_fields("Date of Birth (DOB): 2018-05-15")
+
+    assert fields["dob"] == {"value": "05/15/2018", "confidence": 0.95}
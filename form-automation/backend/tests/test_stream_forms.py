@@ -0,0 +1,29 @@
+# test_stream_forms.py
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize("body", [
+    {"delivery": "stream", "formData": {}, "forms": "ibhs"},
+    {"delivery": "stream", "formData": {}, "forms": ["ibhs", 3]},
+    {"delivery": "stream", "formData": None},
+    {"delivery": "stream", "formData": ["ibhs"]},
+    {"delivery": "stream", "formData": {"ibhs": "Amy Smith"}, "forms": ["ibhs"]},
+    {"formData": "ibhs"},
+])
+def test_malformed_bodies_are_rejected(client, body):
+    response = client.post('/api/generate-forms', json=body)
+    assert response.status_code == 400
+    assert "error" in response.json
+
+
+def test_unknown_form_type_is_rejected(client):
+    response = client.post('/api/generate-forms', json={"delivery": "stream", "formData": {}, "forms": ["nope"]})
+    assert response.status_code == 400
+    assert response.json["error"] == "Unknown form types: nope"
@@ -0,0 +1,33 @@
+# test_text_chunking.py
+import re
+import time
+
+from text_chunking import split_into_chunks, extract_in_chunks, count_tokens
+
+FILLER = "Progress note about therapy sessions and school attendance. " * 60
+
+
+def _document(codes):
+    pages = [f"Diagnosis: Condition ({code})\n\n{FILLER}" for code in codes]
+    return "\n\f\n".join(pages)
+
+
+def test_chunks_respect_budget_and_keep_text():
+    text = _document(["F90.0", "F41.1", "F84.0", "F32.9"])
+    chunks = split_into_chunks(text, max_tokens=1000)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 1000 for chunk in chunks)
+    assert re.findall(r"F\d+\.\d", "".join(chunks)) == ["F90.0", "F41.1", "F84.0", "F32.9"]
+
+
+def test_chunked_extraction_keeps_diagnoses_in_document_order():
+    codes = ["F90.0", "F84.0", "F41.1", "F32.9"]
+
+    def extract(chunk):
+        found = re.findall(r"F\d+\.\d", chunk)
+        # Later chunks finish first, so completion order differs from document order
+        time.sleep(0.05 if "F90.0" in found else 0)
+        return {"diagnoses": [{"name": "Condition", "code": code} for code in found]}
+
+    result = extract_in_chunks(_document(codes), extract, max_tokens=1000)
+    assert [diagnosis["code"] for diagnosis in result["diagnoses"]] == codes
@@ -0,0 +1,35 @@
+# test_text_prefilter.py
+import os
+
+from text_chunking import count_tokens
+from text_prefilter import prefilter_text, CLINICAL_KEYWORD_GROUPS, PATIENT_KEYWORD_GROUPS
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def _sample_ehr():
+    with open(os.path.join(DATA_DIR, "amy_smith_ehr_record.txt"), encoding="utf-8") as handle:
+        return handle.read()
+
+
+def test_output_stays_within_the_token_budget():
+    text = _sample_ehr()
+    assert count_tokens(text) > 200
+
+    for keyword_groups in (PATIENT_KEYWORD_GROUPS, CLINICAL_KEYWORD_GROUPS):
+        filtered = prefilter_text(text, keyword_groups, max_tokens=200)
+        assert 0 < count_tokens(filtered) <= 200
+
+
+def test_most_relevant_sections_are_kept_first():
+    filtered = prefilter_text(_sample_ehr(), max_tokens=200)
+
+    assert "Name: Amy Smith" in filtered
+    assert "Date of Birth (DOB): 2018-05-15" in filtered
+    assert "F84.0" in prefilter_text(_sample_ehr(), CLINICAL_KEYWORD_GROUPS, max_tokens=200)
+
+
+def test_text_within_budget_only_loses_noise():
+    text = "Patient Name: Amy Smith\n\nPage 1 of 2\n\n![img](page.png)\n\nDiagnosis: ADHD (F90.0)"
+
+    assert prefilter_text(text, max_tokens=1000) == "Patient Name: Amy Smith\n\nDiagnosis: ADHD (F90.0)"
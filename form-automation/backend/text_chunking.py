@@ -0,0 +1,166 @@
+# text_chunking.py
+import os
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Largest document slice sent in one extraction prompt, in tokens
+EXTRACTION_CHUNK_TOKENS = int(os.environ.get('EXTRACTION_CHUNK_TOKENS', 4000))
+# Chunks of one document extracted at the same time
+EXTRACTION_CHUNK_WORKERS = int(os.environ.get('EXTRACTION_CHUNK_WORKERS', 4))
+
+# Rough size of a token in English text, used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
+# Page separator written by ocr_pipeline between pages
+PAGE_BREAK_RE = re.compile(r"\n\f\n")
+# Blank lines and markdown headings (Mistral OCR output) start a new section
+SECTION_BREAK_RE = re.compile(r"\n\s*\n|\n(?=#{1,6} )")
+LINE_BREAK_RE = re.compile(r"\n")
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _get_encoding(model):
+    """Return the tiktoken encoding of a model, or None when tiktoken is unavailable"""
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                logger.info(f"tiktoken unavailable ({str(e)}), estimating tokens from characters")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text, model="gpt-4o"):
+    """
+    Count the tokens of a text for a model.
+
+    Args:
+        text (str): Text to measure
+        model (str): Model whose tokenizer to use
+
+    Returns:
+        int: Exact count with tiktoken, otherwise an estimate of one token per four characters
+    """
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _split_oversized(text, max_tokens, model):
+    """Split a piece that is larger than a chunk: by section, then by line, then by size"""
+    for pattern in (SECTION_BREAK_RE, LINE_BREAK_RE):
+        parts = [part for part in pattern.split(text) if part.strip()]
+        if len(parts) > 1:
+            pieces = []
+            for part in parts:
+                if count_tokens(part, model) > max_tokens:
+                    pieces.extend(_split_oversized(part, max_tokens, model))
+                else:
+                    pieces.append(part)
+            return pieces
+
+    # A single huge line: cut it into equal slices that fit
+    slices = -(-count_tokens(text, model) // max_tokens)
+    size = -(-len(text) // slices)
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+
+def split_into_chunks(text, max_tokens=EXTRACTION_CHUNK_TOKENS, model="gpt-4o"):
+    """
+    Split a document into chunks of at most max_tokens tokens on natural boundaries.
+
+    Whole pages are packed together while they fit; a page larger than a chunk is
+    split at section boundaries (blank lines, markdown headings), then at lines. The
+    split depends only on the text, so identical documents always produce identical
+    chunks (and identical, cacheable prompts).
+
+    Args:
+        text (str): Document text
+        max_tokens (int): Token budget per chunk
+        model (str): Model whose tokenizer to use
+
+    Returns:
+        list: Chunks in document order (a single chunk if the text fits)
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+
+    pieces = []
+    for page in PAGE_BREAK_RE.split(text):
+        if not page.strip():
+            continue
+        if count_tokens(page, model) > max_tokens:
+            pieces.extend(_split_oversized(page, max_tokens, model))
+        else:
+            pieces.append(page)
+
+    chunks = []
+    current, current_tokens = [], 0
+    for piece in pieces:
+        piece_tokens = count_tokens(piece, model)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+
+    logger.info(f"Split {len(text)} characters into {len(chunks)} chunks of up to {max_tokens} tokens")
+    return chunks
+
+
+def map_chunks(func, chunks, max_workers=EXTRACTION_CHUNK_WORKERS):
+    """
+    Apply func to every chunk concurrently.
+
+    Args:
+        func (callable): Called as func(chunk)
+        chunks (list): Chunks from split_into_chunks
+        max_workers (int): Chunks processed at the same time
+
+    Returns:
+        list: Results in chunk order
+    """
+    if len(chunks) == 1:
+        return [func(chunks[0])]
+
+    with ThreadPoolExecutor(max_workers=max(min(max_workers, len(chunks)), 1),
+                            thread_name_prefix="extract-chunk") as executor:
+        return list(executor.map(func, chunks))
+
+
+def extract_in_chunks(text, extract_chunk, max_tokens=EXTRACTION_CHUNK_TOKENS):
+    """
+    Run an extraction over the whole document, chunk by chunk, and merge the results.
+
+    Args:
+        text (str): Document text
+        extract_chunk (callable): Called as extract_chunk(chunk); returns a dict
+        max_tokens (int): Token budget per chunk
+
+    Returns:
+        dict: The single result for short documents, otherwise the partial results
+              merged with merge_patient_records in chunk order, so lists such as
+              diagnoses keep document order whatever order the chunks finish in
+    """
+    results = map_chunks(extract_chunk, split_into_chunks(text, max_tokens))
+    if len(results) == 1:
+        return results[0]
+
+    # Imported here rather than at module level: utils configures logging on import
+    from utils import merge_patient_records
+    return merge_patient_records(results)
@@ -0,0 +1,167 @@
+# text_layer.py
+import os
+import re
+import hashlib
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Pages scoring below this are treated as scanned images and sent to OCR
+MIN_TEXT_QUALITY = float(os.environ.get('TEXT_LAYER_MIN_SCORE', 0.6))
+
+# Fewer non-whitespace characters than this means the page has no usable text layer
+MIN_PAGE_CHARS = 25
+
+# Pages mostly covered by images with little text are scans with a thin OCR layer
+SCANNED_IMAGE_COVERAGE = 0.8
+SCANNED_MAX_CHARS = 200
+
+_CID_PATTERN = re.compile(r"\(cid:\d+\)")
+_WORD_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9'.,:;()/#&%-]*$")
+
+
+def score_text_quality(text):
+    """
+    Score how usable an embedded text layer is.
+
+    Born-digital pages score close to 1.0; empty pages, pages with broken font
+    encodings ("(cid:12)" runs) or garbage from a poor scanner OCR layer score low.
+
+    Args:
+        text (str): Text extracted from a single page
+
+    Returns:
+        float: Quality score between 0.0 and 1.0
+    """
+    if not text:
+        return 0.0
+
+    stripped = text.strip()
+    visible_chars = len(re.sub(r"\s", "", stripped))
+    if visible_chars < MIN_PAGE_CHARS:
+        return 0.0
+
+    # Unmapped glyphs mean the text layer cannot be trusted
+    cid_chars = sum(len(match) for match in _CID_PATTERN.findall(stripped))
+    cid_penalty = 1.0 - min(cid_chars / len(stripped), 1.0)
+
+    printable = sum(1 for ch in stripped if ch.isprintable() or ch.isspace()) / len(stripped)
+
+    tokens = stripped.split()
+    wordlike = sum(1 for token in tokens if _WORD_PATTERN.match(token)) / len(tokens)
+
+    return round(printable * wordlike * cid_penalty, 3)
+
+
+def _image_coverage(page):
+    """Fraction of the page area covered by embedded images"""
+    page_area = float(page.width * page.height) or 1.0
+    covered = 0.0
+    for image in page.images:
+        width = max(float(image.get('x1', 0)) - float(image.get('x0', 0)), 0.0)
+        height = max(float(image.get('bottom', 0)) - float(image.get('top', 0)), 0.0)
+        covered += width * height
+    return min(covered / page_area, 1.0)
+
+
+def extract_text_layer(file_path):
+    """
+    Extract the embedded text layer of a PDF page by page and flag pages that need OCR.
+
+    Args:
+        file_path (str): Path to the PDF
+
+    Returns:
+        tuple: (page_texts, scanned_pages) where page_texts is a list with one string per
+               page and scanned_pages lists the zero-based indexes of pages that must be
+               OCR'd. Returns (None, None) if the text layer could not be read.
+    """
+    try:
+        import pdfplumber
+    except ImportError:
+        logger.warning("pdfplumber is not installed, skipping text layer extraction")
+        return None, None
+
+    page_texts = []
+    scanned_pages = []
+
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            for page_num, page in enumerate(pdf.pages):
+                text = page.extract_text() or ""
+                score = score_text_quality(text)
+                visible_chars = len(re.sub(r"\s", "", text))
+
+                is_scanned = score < MIN_TEXT_QUALITY
+                if not is_scanned and visible_chars < SCANNED_MAX_CHARS:
+                    is_scanned = _image_coverage(page) >= SCANNED_IMAGE_COVERAGE
+
+                logger.debug(f"Page {page_num}: {visible_chars} chars, quality {score}, scanned={is_scanned}")
+                page_texts.append(text)
+                if is_scanned:
+                    scanned_pages.append(page_num)
+    except Exception as e:
+        logger.warning(f"Could not read PDF text layer: {str(e)}")
+        return None, None
+
+    logger.info(f"Text layer usable on {len(page_texts) - len(scanned_pages)}/{len(page_texts)} pages")
+    return page_texts, scanned_pages
+
+
+def write_pdf_pages(source_path, page_indexes, output_path):
+    """
+    Write a subset of the pages of a PDF to a new file.
+
+    Args:
+        source_path (str): Path to the source PDF
+        page_indexes (list): Zero-based indexes of the pages to keep, in order
+        output_path (str): Destination path
+    """
+    from PyPDF2 import PdfReader, PdfWriter
+
+    with open(source_path, "rb") as f:
+        reader = PdfReader(f)
+        writer = PdfWriter()
+        for page_num in page_indexes:
+            writer.add_page(reader.pages[page_num])
+        with open(output_path, "wb") as output_file:
+            writer.write(output_file)
+
+
+def page_fingerprint(page):
+    """
+    Hash what a PDF page looks like, independent of how the surrounding file is laid out.
+
+    Covers the page's content stream, its size and the data of the XObjects (scanned
+    images, form XObjects) it draws, so an unchanged page keeps its fingerprint when
+    the rest of the document is regenerated or edited.
+
+    Args:
+        page (PyPDF2.PageObject): Page to fingerprint
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(repr([float(value) for value in page.mediabox]).encode("utf-8"))
+
+    contents = page.get('/Contents')
+    contents = contents.get_object() if contents is not None else None
+    # A page's content is either a single stream or an array of streams
+    streams = contents if isinstance(contents, list) else [contents] if contents is not None else []
+    for stream in streams:
+        digest.update(stream.get_object().get_data())
+
+    resources = page.get('/Resources')
+    resources = resources.get_object() if resources is not None else None
+    xobjects = resources.get('/XObject') if resources else None
+    if xobjects:
+        xobjects = xobjects.get_object()
+        for name in sorted(xobjects.keys()):
+            xobject = xobjects[name].get_object()
+            digest.update(name.encode("utf-8"))
+            # Raw stream bytes are enough to detect a changed image without decoding it
+            digest.update(getattr(xobject, '_data', b"") or b"")
+
+    return digest.hexdigest()
@@ -0,0 +1,178 @@
+# text_prefilter.py
+import os
+import re
+import logging
+from collections import Counter
+
+from text_chunking import PAGE_BREAK_RE, SECTION_BREAK_RE, count_tokens, split_into_chunks
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Token budget of the filtered text; the most relevant sections are kept up to it
+PREFILTER_MAX_TOKENS = int(os.environ.get('PREFILTER_MAX_TOKENS', 6000))
+# Sections longer than this share of the budget are ranked in pieces
+PREFILTER_PIECES = 4
+# A line seen on at least this many pages is page furniture (headers, footers)
+PREFILTER_REPEAT_PAGES = int(os.environ.get('PREFILTER_REPEAT_PAGES', 3))
+# Lines at least this long are dropped when copied from an earlier page even if rarer
+REPEATED_LINE_MIN_LENGTH = 40
+
+# Keyword groups scored per section. A section scores one point per group it mentions
+# plus one per additional hit, so a diagnosis list outranks a passing mention.
+DEMOGRAPHIC_KEYWORDS = re.compile(
+    r"\b(?:patient|client|name|d\.?o\.?b\.?|date of birth|birth ?date|born|age|gender|sex)\b", re.IGNORECASE)
+GUARDIAN_KEYWORDS = re.compile(
+    r"\b(?:guardian|parent|mother|father|caregiver|custod\w*|legal rep\w*)\b", re.IGNORECASE)
+DIAGNOSIS_KEYWORDS = re.compile(
+    r"\b(?:diagnos\w*|dx|icd(?:-?10)?|disorder|impression|assessment)\b|\b[A-TV-Z]\d{2}\.\d{1,4}\b", re.IGNORECASE)
+SYMPTOM_KEYWORDS = re.compile(
+    r"\b(?:symptom\w*|behavio\w*|present\w* (?:problem|concern)s?|complain\w*|concern\w*|"
+    r"tantrum\w*|aggress\w*|anxi\w*|sleep|attention|hyperactiv\w*|mood)\b", re.IGNORECASE)
+DATE_PATTERN = re.compile(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b")
+
+# Keyword groups for the patient data prompt and the clinical (diagnoses/symptoms) prompt
+PATIENT_KEYWORD_GROUPS = (DEMOGRAPHIC_KEYWORDS, GUARDIAN_KEYWORDS, DIAGNOSIS_KEYWORDS,
+                          SYMPTOM_KEYWORDS, DATE_PATTERN)
+CLINICAL_KEYWORD_GROUPS = (DIAGNOSIS_KEYWORDS, SYMPTOM_KEYWORDS)
+
+# Layout noise left by OCR and PDF text layers
+IMAGE_REF_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+TABLE_RULE_RE = re.compile(r"^\s*\|?(?:\s*:?-{2,}:?\s*\|)+\s*:?-*:?\s*$")
+# "Page 3", "Page 3 of 10", "3 of 10", "- 3 -"; a bare number may be a form value and is kept
+PAGE_NUMBER_RE = re.compile(r"^\s*(?:page\s*\d+(?:\s*of\s*\d+)?|\d+\s+of\s+\d+|[-–—]\s*\d+\s*[-–—])\s*$",
+                            re.IGNORECASE)
+NOISE_LINE_RE = re.compile(r"^[\W_]*$")
+INLINE_SPACE_RE = re.compile(r"[ \t\u00a0]+")
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+DIGITS_RE = re.compile(r"\d+")
+
+
+def _normalize_line(line):
+    """Key used to recognise the same line on different pages (page numbers ignored)"""
+    return DIGITS_RE.sub("#", INLINE_SPACE_RE.sub(" ", line).strip().lower())
+
+
+def _clean_page(page):
+    """Drop image references, table rules, page numbers and lines without any word"""
+    lines = []
+    for line in IMAGE_REF_RE.sub("", page).split("\n"):
+        line = INLINE_SPACE_RE.sub(" ", line).rstrip()
+        if line and (TABLE_RULE_RE.match(line) or PAGE_NUMBER_RE.match(line) or NOISE_LINE_RE.match(line)):
+            continue
+        lines.append(line)
+    return lines
+
+
+def _dedupe_lines(pages):
+    """
+    Remove lines repeated from earlier pages.
+
+    Lines recurring on PREFILTER_REPEAT_PAGES or more pages (running headers and
+    footers) and long lines copied from an earlier page are kept only where they first
+    appear, so a header carrying the patient's name still reaches the prompt once.
+    Repeats within one page (table cells, checklists) are left alone.
+    """
+    pages_per_line = Counter()
+    for lines in pages:
+        pages_per_line.update({_normalize_line(line) for line in lines if line.strip()})
+
+    seen = set()
+    deduped = []
+    for lines in pages:
+        kept = []
+        page_keys = set()
+        for line in lines:
+            key = _normalize_line(line)
+            if key and key in seen and (pages_per_line[key] >= PREFILTER_REPEAT_PAGES
+                                        or len(key) >= REPEATED_LINE_MIN_LENGTH):
+                continue
+            page_keys.add(key)
+            kept.append(line)
+        seen.update(page_keys)
+        deduped.append("\n".join(kept))
+    return deduped
+
+
+def score_section(section, keyword_groups=PATIENT_KEYWORD_GROUPS):
+    """
+    Score how relevant a section is to the extraction.
+
+    Args:
+        section (str): Section text
+        keyword_groups (tuple): Compiled keyword patterns
+
+    Returns:
+        int: 0 for sections without any keyword
+    """
+    score = 0
+    for pattern in keyword_groups:
+        hits = len(pattern.findall(section))
+        if hits:
+            score += 1 + min(hits - 1, 4)
+    return score
+
+
+def prefilter_text(text, keyword_groups=PATIENT_KEYWORD_GROUPS, max_tokens=PREFILTER_MAX_TOKENS):
+    """
+    Shrink OCR text before it goes into an extraction prompt.
+
+    Layout noise is stripped and lines repeated across pages are removed. If the result
+    still exceeds max_tokens, sections (split where longer than a quarter of the budget)
+    are ranked by keyword relevance, sections without a keyword by that of their
+    neighbours, and added best first while they fit in max_tokens; the rest is dropped.
+    Kept sections stay in document order, and the output depends only on the input, so
+    prompts remain cacheable.
+
+    Args:
+        text (str): Document text (pages joined with ocr_pipeline.PAGE_SEPARATOR)
+        keyword_groups (tuple): Compiled keyword patterns that make a section relevant
+        max_tokens (int): Token budget for the filtered text
+
+    Returns:
+        str: Filtered text of at most max_tokens tokens
+    """
+    if not text:
+        return text
+
+    pages = _dedupe_lines([_clean_page(page) for page in PAGE_BREAK_RE.split(text)])
+    sections = [section.strip() for page in pages for section in SECTION_BREAK_RE.split(page)]
+    sections = [section for section in sections if section]
+    cleaned = BLANK_LINES_RE.sub("\n\n", "\n\n".join(sections))
+
+    if count_tokens(cleaned) <= max_tokens:
+        logger.info(f"Prefilter reduced {len(text)} to {len(cleaned)} characters (noise and repeats)")
+        return cleaned
+
+    # Sections are ranked in pieces of at most a quarter of the budget, so one long page
+    # cannot take (or miss) the whole budget at once
+    piece_tokens = max(max_tokens // PREFILTER_PIECES, 1)
+    sections = [piece for section in sections for piece in split_into_chunks(section, piece_tokens)]
+    scores = [score_section(section, keyword_groups) for section in sections]
+    # Unscored sections next to relevant ones often carry their content (a heading's body)
+    ranks = []
+    for index, score in enumerate(scores):
+        neighbour = max(scores[max(index - 1, 0):index + 2])
+        ranks.append((score if score else neighbour / 2, -index))
+
+    # One token per section is reserved for the blank line joining it to the next
+    kept = []
+    budget = max_tokens
+    for rank, negative_index in sorted(ranks, reverse=True):
+        index = -negative_index
+        tokens = count_tokens(sections[index]) + 1
+        if tokens <= budget:
+            kept.append(index)
+            budget -= tokens
+
+    def joined(indexes):
+        return "\n\n".join(sections[index] for index in sorted(indexes))
+
+    filtered = joined(kept)
+    # Tokenizers can merge differently across the joins; drop the least relevant if so
+    while kept and count_tokens(filtered) > max_tokens:
+        kept.pop()
+        filtered = joined(kept)
+    logger.info(f"Prefilter reduced {len(text)} to {len(filtered)} characters "
+                f"({len(kept)} of {len(sections)} sections kept)")
+    return filtered
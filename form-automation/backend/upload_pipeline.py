@@ -0,0 +1,656 @@
+# upload_pipeline.py
+import os
+import json
+import logging
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from clients import get_mistral_client, get_openai_client
+from task_graph import TaskGraph
+from ocr_pipeline import ocr_document
+from llm_cache import cached_chat_completion
+from text_chunking import extract_in_chunks
+from text_prefilter import prefilter_text, CLINICAL_KEYWORD_GROUPS
+from metrics import stage_timer, get_metrics
+from data_extraction import score_rule_based_fields, low_confidence_fields
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Documents of a batch upload processed at once
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 4))
+
+# Fields the patient extraction must fill. When the rule-based pass finds all of them
+# with confidence (e.g. a structured EHR header), no LLM call is made at all.
+# Diagnoses and symptoms always come from the clinical extraction.
+REQUIRED_PATIENT_FIELDS = ('name', 'dob', 'guardian', 'gender', 'guardian_relationship')
+# Always part of a narrowed prompt, even when the rules found them: they are cheap to
+# ask for once a call is made and the rules often miss them
+ALWAYS_REQUESTED_FIELDS = ('gender', 'guardian_relationship')
+
+# What the narrowed patient prompt asks for, per field of the patient data
+PATIENT_FIELD_DESCRIPTIONS = {
+    'name': "Full name of the patient",
+    'dob': "Date of birth in format MM/DD/YYYY",
+    'age': "Numeric age",
+    'gender': "Patient's gender",
+    'guardian_name': "Full name of parent/guardian (if patient is a minor)",
+    'guardian_relationship': "Relationship of the guardian to the patient"
+}
+
+# Rule-based field -> patient data key
+RULE_FIELD_KEYS = {'name': 'name', 'dob': 'dob', 'age': 'age', 'guardian': 'guardian_name',
+                   'gender': 'gender', 'guardian_relationship': 'guardian_relationship'}
+
+# Progress event emitted when each pipeline task finishes, and the result key it carries
+# (tasks without an entry emit nothing)
+TASK_EVENTS = {
+    'clinical_data': ('clinical_extraction_done', None),
+    'patient_data': ('extraction_done', 'patientData'),
+    'measurable_goals': ('goals_done', 'measurableGoals'),
+    'form_data': ('mapping_done', 'formData')
+}
+
+
+def _preview_text(extracted_text):
+    """Truncate extracted text for API responses"""
+    return extracted_text[:3000] + "..." if len(extracted_text) > 3000 else extracted_text
+
+
+def process_uploaded_file(file_path, unique_filename, mistral_api_key, openai_api_key, bypass_cache=False,
+                          progress=None, content_hash=None):
+    """
+    Run the full OCR + ChatGPT pipeline for a file that has already been saved to disk.
+    
+    Args:
+        file_path (str): Path to the saved upload
+        unique_filename (str): Name the file was saved under (sent to Mistral)
+        mistral_api_key (str): Mistral API key
+        openai_api_key (str): OpenAI API key
+        bypass_cache (bool): Ignore cached LLM responses and refresh them
+        progress (callable, optional): progress(stage, **data) callback receiving partial
+                                       results as each stage finishes
+        content_hash (str, optional): SHA-256 of the file, if already computed while saving it
+        
+    Returns:
+        dict: Processed data (extracted text, patient data, goals and form data)
+    """
+    logger.info("Processing document with Mistral OCR and ChatGPT analysis...")
+    
+    # Shared client; keeps connections to Mistral alive between uploads
+    mistral_client = get_mistral_client(mistral_api_key)
+
+    start_ocr = time.time()
+    extracted_text = ocr_document(mistral_client, file_path, unique_filename, progress=progress,
+                                  content_hash=content_hash)
+    ocr_time = time.time() - start_ocr
+
+    # If we still don't have text after all attempts, use fallback sample
+    if not extracted_text:
+        logger.warning("Using sample text for testing since extraction failed")
+        extracted_text = (
+            "PATIENT NAME: John Smith\n"
+            "DOB: 01/15/2010\n"
+            "GUARDIAN: Jane Smith (Mother)\n"
+            "DIAGNOSIS: Attention Deficit Hyperactivity Disorder (F90.0)\n"
+            "ASSESSMENT DATE: 02/20/2023\n"
+            "SYMPTOMS: Difficulty concentrating, hyperactivity, impulsivity\n"
+            "TREATMENT GOALS: Improve focus, reduce disruptive behaviors"
+        )
+
+    logger.info(f"Final extracted text length: {len(extracted_text)} characters")
+    if progress:
+        progress('ocr_done', seconds=round(ocr_time, 3), extractedText=_preview_text(extracted_text))
+
+    # Use OpenAI to process the extracted text
+    openai_client = get_openai_client(openai_api_key)
+
+    # The goals prompt only needs diagnoses and symptoms, so a small clinical extraction
+    # feeds goal generation while the patient fields are extracted alongside it.
+    # Form mapping starts as soon as both branches have finished.
+    logger.info("Processing with OpenAI ChatGPT...")
+    graph = TaskGraph()
+    _add_extraction_tasks(graph, openai_client, extracted_text, bypass_cache)
+    graph.add('measurable_goals',
+              lambda clinical_data: generate_measurable_goals(openai_client, clinical_data, bypass_cache),
+              depends_on=['clinical_data'])
+    graph.add('form_data',
+              lambda patient_data, measurable_goals: map_to_forms(openai_client, patient_data, measurable_goals, bypass_cache),
+              depends_on=['patient_data', 'measurable_goals'])
+
+    def on_task_done(name, result, seconds):
+        if name not in TASK_EVENTS:
+            return
+        stage, result_key = TASK_EVENTS[name]
+        data = {result_key: result} if result_key else {}
+        progress(stage, seconds=round(seconds, 3), **data)
+
+    results = graph.run(on_task_done=on_task_done if progress else None)
+
+    patient_data = results['patient_data']
+    measurable_goals = results['measurable_goals']
+    form_data = results['form_data']
+
+    # Store the file ID for reference
+    file_id = str(uuid.uuid4())
+
+    # Return the processed data
+    return {
+        "status": "success",
+        "fileId": file_id,
+        "extractedText": _preview_text(extracted_text),
+        "patientData": patient_data,
+        "measurableGoals": measurable_goals,
+        "formData": form_data
+    }
+
+
+def process_uploaded_batch(files, mistral_api_key, openai_api_key, bypass_cache=False, progress=None):
+    """
+    Run the upload pipeline for several saved files at once.
+
+    Files with identical content are processed once; later copies point at the first
+    one through duplicateOf. The unique files fan out over a bounded worker pool, and a
+    failure in one file does not affect the others.
+
+    Args:
+        files (list): Dicts with fileName, filePath, uniqueFilename and contentHash, in upload order
+        mistral_api_key (str): Mistral API key
+        openai_api_key (str): OpenAI API key
+        bypass_cache (bool): Ignore cached LLM responses and refresh them
+        progress (callable, optional): progress(stage, **data) callback receiving a
+                                       'file_done' event per processed file
+
+    Returns:
+        dict: Per-file results in upload order and an aggregate summary
+    """
+    start_time = time.time()
+
+    # First upload of each content hash is the one that gets processed
+    unique_files = {}
+    for index, entry in enumerate(files):
+        unique_files.setdefault(entry['contentHash'], index)
+
+    logger.info(f"Processing batch of {len(files)} files ({len(unique_files)} unique) "
+                f"with {BATCH_MAX_WORKERS} workers")
+
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=max(min(BATCH_MAX_WORKERS, len(unique_files)), 1),
+                            thread_name_prefix="batch-upload") as executor:
+        futures = {
+            executor.submit(process_uploaded_file, files[index]['filePath'], files[index]['uniqueFilename'],
+                            mistral_api_key, openai_api_key, bypass_cache,
+                            content_hash=files[index]['contentHash']): index
+            for index in unique_files.values()
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                outcomes[index] = {"status": "success", "result": future.result()}
+            except Exception as e:
+                logger.error(f"Batch file {files[index]['fileName']} failed: {str(e)}")
+                logger.error(traceback.format_exc())
+                outcomes[index] = {"status": "error", "error": f"Processing error: {str(e)}"}
+
+            if progress:
+                progress('file_done', fileName=files[index]['fileName'], status=outcomes[index]['status'],
+                         completed=len(outcomes), total=len(unique_files))
+
+    results = []
+    for index, entry in enumerate(files):
+        first_index = unique_files[entry['contentHash']]
+        item = {
+            "fileName": entry['fileName'],
+            "contentHash": entry['contentHash']
+        }
+        if first_index != index:
+            item["duplicateOf"] = files[first_index]['fileName']
+        item.update(outcomes[first_index])
+        results.append(item)
+
+    succeeded = sum(1 for outcome in outcomes.values() if outcome['status'] == 'success')
+    return {
+        "status": "success",
+        "results": results,
+        "summary": {
+            "total": len(files),
+            "unique": len(unique_files),
+            "duplicates": len(files) - len(unique_files),
+            "succeeded": succeeded,
+            "failed": len(unique_files) - succeeded,
+            "seconds": round(time.time() - start_time, 3)
+        }
+    }
+
+
+def process_patient_documents(files, mistral_api_key, openai_api_key, bypass_cache=False, progress=None):
+    """
+    Run the upload pipeline for several documents that belong to the same patient.
+
+    Each document is OCR'd and extracted in parallel; the extractions are then folded
+    into one record with merge_patient_records, so goal generation and form mapping
+    run once for the patient instead of once per document. A document that fails is
+    listed with its error and left out of the merge; the job only fails when no
+    document could be extracted.
+
+    Args:
+        files (list): Dicts with fileName, filePath, uniqueFilename and contentHash
+        mistral_api_key (str): Mistral API key
+        openai_api_key (str): OpenAI API key
+        bypass_cache (bool): Ignore cached LLM responses and refresh them
+        progress (callable, optional): progress(stage, **data) callback
+
+    Returns:
+        dict: Same shape as process_uploaded_file, plus the per-document extractions
+              ({fileName, error} for documents that failed)
+    """
+    # Imported here rather than at module level: utils configures logging on import
+    from utils import merge_patient_records
+
+    mistral_client = get_mistral_client(mistral_api_key)
+    openai_client = get_openai_client(openai_api_key)
+
+    # The same document uploaded twice adds nothing to the merge
+    unique_files = list({entry['contentHash']: entry for entry in reversed(files)}.values())[::-1]
+    logger.info(f"Processing {len(unique_files)} documents for one patient")
+
+    def extract_document(entry):
+        extracted_text = ocr_document(mistral_client, entry['filePath'], entry['uniqueFilename'],
+                                      content_hash=entry['contentHash'])
+        if not extracted_text:
+            logger.warning(f"No text extracted from {entry['fileName']}, leaving it out of the merge")
+            return {"entry": entry, "text": extracted_text, "clinical_data": None, "patient_data": None}
+
+        graph = TaskGraph()
+        _add_extraction_tasks(graph, openai_client, extracted_text, bypass_cache)
+        results = graph.run()
+        return {"entry": entry, "text": extracted_text, "clinical_data": results['clinical_data'],
+                "patient_data": results['patient_data']}
+
+    # A document that fails is reported and left out of the merge, like a failed file of a batch
+    documents = []
+    with ThreadPoolExecutor(max_workers=max(min(BATCH_MAX_WORKERS, len(unique_files)), 1),
+                            thread_name_prefix="patient-document") as executor:
+        futures = {executor.submit(extract_document, entry): entry for entry in unique_files}
+        for future in as_completed(futures):
+            entry = futures[future]
+            try:
+                documents.append(future.result())
+            except Exception as e:
+                logger.error(f"Patient document {entry['fileName']} failed: {str(e)}")
+                logger.error(traceback.format_exc())
+                documents.append({"entry": entry, "error": f"Processing error: {str(e)}"})
+            if progress:
+                progress('document_done', fileName=entry['fileName'],
+                         status="error" if "error" in documents[-1] else "success",
+                         completed=len(documents), total=len(unique_files))
+
+    # Keep upload order in the response; the merge itself does not depend on order
+    order = {entry['contentHash']: index for index, entry in enumerate(unique_files)}
+    documents.sort(key=lambda document: order[document['entry']['contentHash']])
+    extracted = [document for document in documents if document.get('clinical_data') is not None]
+    if not extracted:
+        errors = [document['error'] for document in documents if 'error' in document]
+        if errors:
+            raise ValueError(f"None of the documents could be processed: {errors[0]}")
+        raise ValueError("No text could be extracted from any of the documents")
+
+    clinical_data = merge_patient_records([document['clinical_data'] for document in extracted])
+    patient_data = merge_patient_records([document['patient_data'] for document in extracted])
+    if progress:
+        progress('extraction_done', patientData=patient_data)
+
+    measurable_goals = generate_measurable_goals(openai_client, clinical_data, bypass_cache)
+    if progress:
+        progress('goals_done', measurableGoals=measurable_goals)
+
+    form_data = map_to_forms(openai_client, patient_data, measurable_goals, bypass_cache)
+    if progress:
+        progress('mapping_done', formData=form_data)
+
+    extracted_text = "\n\n".join(f"=== {document['entry']['fileName']} ===\n{document['text']}"
+                                  for document in extracted)
+
+    return {
+        "status": "success",
+        "fileId": str(uuid.uuid4()),
+        "extractedText": _preview_text(extracted_text),
+        "patientData": patient_data,
+        "measurableGoals": measurable_goals,
+        "formData": form_data,
+        "documents": [_document_summary(document) for document in documents]
+    }
+
+
+def _document_summary(document):
+    """Per-document entry of a patient result: its extraction, or the error it failed with"""
+    summary = {"fileName": document['entry']['fileName'], "contentHash": document['entry']['contentHash']}
+    if 'error' in document:
+        summary["error"] = document['error']
+    else:
+        summary["extractedText"] = _preview_text(document['text'] or "")
+        summary["patientData"] = document['patient_data']
+    return summary
+
+
+def _add_extraction_tasks(graph, openai_client, extracted_text, bypass_cache=False):
+    """
+    Add the clinical and patient extraction tasks to a pipeline graph.
+    
+    'clinical_data' and 'patient_fields' run side by side; 'patient_data' completes the
+    patient fields with the diagnoses and symptoms of the clinical extraction.
+    """
+    graph.add('clinical_data', lambda: extract_clinical_data(openai_client, extracted_text, bypass_cache))
+    graph.add('patient_fields', lambda: extract_patient_data(openai_client, extracted_text, bypass_cache))
+    graph.add('patient_data', complete_patient_data, depends_on=['patient_fields', 'clinical_data'])
+
+
+def extract_patient_data(openai_client, extracted_text, bypass_cache=False):
+    """
+    Extract the patient's demographics and guardian, rule-based first.
+    
+    The regex extractors run over the whole text and score each value. When name, DOB,
+    gender, guardian and guardian relationship are all found with confidence, no LLM
+    call is made. Otherwise the LLM gets a prompt asking only for the missing or
+    low-confidence fields, an uncertain age, and always gender and guardian relationship;
+    its answers replace only values the rules were not confident about.
+    
+    Args:
+        openai_client (OpenAI): OpenAI client
+        extracted_text (str): OCR text
+        bypass_cache (bool): Ignore cached LLM responses
+        
+    Returns:
+        dict: Patient data (name, dob, age, gender, guardian_name, guardian_relationship,
+              and rule-based diagnoses)
+    """
+    scored_fields = score_rule_based_fields(extracted_text)
+    patient_data = {key: scored_fields[field]["value"] for field, key in RULE_FIELD_KEYS.items()}
+    patient_data["diagnoses"] = scored_fields["diagnoses"]["value"]
+
+    missing = low_confidence_fields(scored_fields, REQUIRED_PATIENT_FIELDS)
+    if not missing:
+        get_metrics().inc('patient_extraction_total', help_text="Patient extractions by path", path="rules")
+        logger.info("Patient data extraction completed from rule-based fields, skipping the LLM")
+        return patient_data
+
+    # Ask for the missing fields and, since a call is being made anyway, an uncertain age
+    uncertain = missing + low_confidence_fields(scored_fields, ['age'])
+    requested = [RULE_FIELD_KEYS[field] for field in uncertain]
+    requested += [field for field in ALWAYS_REQUESTED_FIELDS if field not in requested]
+    logger.info(f"Rule-based extraction missing {missing}, asking the LLM for {requested}")
+    get_metrics().inc('patient_extraction_total', help_text="Patient extractions by path", path="llm")
+
+    # The prompt only needs the relevant sections: noise and repeated page furniture go first
+    with stage_timer('prefilter', prompt='patient'):
+        document_text = prefilter_text(extracted_text)
+    llm_data = extract_in_chunks(
+        document_text, lambda chunk: _extract_patient_data_chunk(openai_client, chunk, requested, bypass_cache))
+
+    # LLM answers fill the gaps; confident rule values stay, and a low-confidence rule
+    # value is still better than nothing
+    for field in uncertain:
+        key = RULE_FIELD_KEYS[field]
+        if llm_data.get(key):
+            patient_data[key] = llm_data[key]
+    logger.info("Patient data extraction completed")
+    return patient_data
+
+
+def _extract_patient_data_chunk(openai_client, document_text, fields, bypass_cache=False):
+    """Run the narrowed patient data extraction prompt for the given fields on one chunk"""
+    field_list = "\n".join(f"    - {key}: {PATIENT_FIELD_DESCRIPTIONS[key]}" for key in fields)
+    extraction_prompt = f"""
+    Extract the following fields about the patient from this medical document into a JSON object
+    (include null for missing fields):
+
+{field_list}
+
+    Respond ONLY with valid JSON.
+
+    Document text:
+    {document_text}
+    """
+
+    content = cached_chat_completion(
+        openai_client,
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are a specialized medical document analyzer."},
+            {"role": "user", "content": extraction_prompt}
+        ],
+        temperature=0.1,
+        response_format={"type": "json_object"},
+        bypass_cache=bypass_cache,
+        stage="patient_extraction"
+    )
+
+    # Parse the JSON response
+    patient_data = json.loads(content)
+    logger.debug(f"Patient data content: {content}")
+    return patient_data
+
+
+def complete_patient_data(patient_fields, clinical_data):
+    """
+    Combine the patient fields with the clinical extraction.
+    
+    Symptoms come from the clinical extraction. Diagnoses are the clinical ones plus any
+    rule-based diagnosis whose ICD code the clinical extraction did not report.
+    
+    Args:
+        patient_fields (dict): Result of extract_patient_data
+        clinical_data (dict): Result of extract_clinical_data
+        
+    Returns:
+        dict: Patient data
+    """
+    diagnoses = list(clinical_data.get("diagnoses") or [])
+    known_codes = {str(diagnosis.get("code") or "").upper() for diagnosis in diagnoses
+                   if isinstance(diagnosis, dict)}
+    for diagnosis in patient_fields.get("diagnoses") or []:
+        if diagnosis["code"].upper() not in known_codes:
+            diagnoses.append(diagnosis)
+            known_codes.add(diagnosis["code"].upper())
+
+    patient_data = dict(patient_fields)
+    patient_data["diagnoses"] = diagnoses
+    patient_data["symptoms"] = clinical_data.get("symptoms") or []
+    return patient_data
+
+
+def extract_clinical_data(openai_client, extracted_text, bypass_cache=False):
+    """
+    Extract only diagnoses and symptoms, which is all goal generation needs.
+    
+    Args:
+        openai_client (OpenAI): OpenAI client
+        extracted_text (str): OCR text
+        bypass_cache (bool): Ignore cached LLM responses
+        
+    Returns:
+        dict: {"diagnoses": [...], "symptoms": [...]}
+    """
+    with stage_timer('prefilter', prompt='clinical'):
+        document_text = prefilter_text(extracted_text, CLINICAL_KEYWORD_GROUPS)
+    clinical_data = extract_in_chunks(
+        document_text, lambda chunk: _extract_clinical_data_chunk(openai_client, chunk, bypass_cache))
+    logger.info("Clinical data extraction completed")
+    return clinical_data
+
+
+def _extract_clinical_data_chunk(openai_client, document_text, bypass_cache=False):
+    """Run the clinical extraction prompt on one chunk of the document"""
+    clinical_prompt = f"""
+    Extract the clinical information from this medical document into a JSON object with two keys:
+    - diagnoses: Array of diagnoses, each with "name" and "code" (if ICD codes present)
+    - symptoms: Array of reported symptoms or behavioral issues
+
+    Use empty arrays when nothing is found. Respond ONLY with valid JSON.
+
+    Document text:
+    {document_text}
+    """
+
+    content = cached_chat_completion(
+        openai_client,
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are a specialized medical document analyzer."},
+            {"role": "user", "content": clinical_prompt}
+        ],
+        temperature=0.1,
+        response_format={"type": "json_object"},
+        bypass_cache=bypass_cache,
+        stage="clinical_extraction"
+    )
+
+    clinical_data = json.loads(content)
+    logger.debug(f"Clinical data content: {content}")
+    return clinical_data
+
+
+def generate_measurable_goals(openai_client, clinical_data, bypass_cache=False):
+    """
+    Generate measurable treatment goals from diagnoses and symptoms.
+    
+    Args:
+        openai_client (OpenAI): OpenAI client
+        clinical_data (dict): Diagnoses and symptoms
+        bypass_cache (bool): Ignore cached LLM responses
+        
+    Returns:
+        list: Goal objects with "objective", "measurement" and "timeframe"
+    """
+    # Generate measurable goals based on diagnoses
+    goals_prompt = f"""
+    Based on the following patient diagnoses, generate appropriate measurable goals and objectives for an IBHS treatment plan.
+
+    Patient diagnoses: {json.dumps(clinical_data.get('diagnoses', []))}
+    Patient symptoms: {json.dumps(clinical_data.get('symptoms', []))}
+
+    Use the following table of common measurable goals and objectives to inform your recommendations:
+
+    Focus Area | Measurable Goals and Objectives
+    -----------|-------------------------------
+    Reduction in Problematic Behaviors | - Decrease frequency and intensity of aggressive behaviors (e.g., number of incidents per week).
+     | - Reduce self-injurious behaviors (e.g., frequency of self-harm episodes).
+     | - Minimize tantrums or meltdowns (e.g., duration and frequency).
+    Improvement in Social Skills | - Increase ability to initiate and maintain conversations (e.g., number of successful interactions).
+     | - Enhance understanding and expression of emotions (e.g., score on emotion recognition tests).
+     | - Foster better peer interactions and friendships (e.g., number of peer engagements).
+    Enhancement of Communication Skills | - Encourage use of verbal communication (e.g., percentage of verbal responses).
+     | - Improve non-verbal communication skills (e.g., effectiveness in gesturing).
+     | - Enhance understanding and following of instructions (e.g., compliance rate).
+    Emotional Regulation | - Develop skills to manage anxiety and stress (e.g., reduction in anxiety scores on standardized scales).
+     | - Teach self-soothing and coping strategies for frustration (e.g., frequency of use).
+     | - Improve emotional expression and control (e.g., fewer emotional outbursts).
+    Independence in Daily Living | - Promote ability to perform personal care tasks (e.g., percentage of tasks completed independently).
+     | - Improve time management and organizational skills (e.g., adherence to schedules).
+     | - Encourage independence in community navigation (e.g., number of successful outings).
+    Academic Performance | - Enhance grades or performance in school subjects (e.g., improvement in test scores).
+     | - Improve attention and focus during class (e.g., percentage of time on task).
+     | - Increase participation in classroom activities (e.g., number of participations).
+    Family and Community Integration | - Increase participation in family activities (e.g., number of family events attended).
+     | - Strengthen relationships with family members (e.g., improvement in family interaction scores).
+     | - Boost involvement in community events and programs (e.g., number of community engagements).
+    Mental Health Symptoms | - Reduce symptoms of depression or anxiety (e.g., decrease in symptom severity on clinical scales).
+     | - Improve sleep patterns and quality (e.g., hours of sleep per night).
+     | - Enhance overall mental well-being (e.g., improvement in well-being assessments).
+
+    Provide at least 3-5 measurable goals that are specifically tailored to the patient's diagnoses and symptoms.
+    For each goal, include:
+    1. A clear objective
+    2. How it will be measured (frequency, duration, etc.)
+    3. A reasonable timeframe for achievement
+
+    Format the response as a JSON array of goal objects, each with "objective", "measurement", and "timeframe" properties.
+    """
+
+    content = cached_chat_completion(
+        openai_client,
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are a behavioral health specialist who creates measurable treatment goals."},
+            {"role": "user", "content": goals_prompt}
+        ],
+        temperature=0.3,
+        response_format={"type": "json_object"},
+        bypass_cache=bypass_cache,
+        stage="goal_generation"
+    )
+
+    # Parse the JSON response
+    measurable_goals = json.loads(content)
+    logger.info("Measurable goals generation completed")
+
+    if isinstance(measurable_goals, dict) and 'goals' in measurable_goals:
+        measurable_goals = measurable_goals['goals']
+
+    logger.debug(f"Measurable goals data: {json.dumps(measurable_goals)}")
+    return measurable_goals
+
+
+def map_to_forms(openai_client, patient_data, measurable_goals, bypass_cache=False):
+    """
+    Map patient data and generated goals to the IBHS and Community Care form fields.
+    
+    Args:
+        openai_client (OpenAI): OpenAI client
+        patient_data (dict): Extracted patient data
+        measurable_goals (list): Generated goals
+        bypass_cache (bool): Ignore cached LLM responses
+        
+    Returns:
+        dict: {"ibhs": {...}, "communityCare": {...}}
+    """
+    # Map to form templates with the generated goals
+    mapping_prompt = f"""
+    Map this patient data to the following two form formats:
+
+    1. IBHS Form fields:
+    - recipient_name: Patient's full name
+    - recipient_dob: Date of birth
+    - recipient_id: Insurance ID or null
+    - guardian_name: Parent/guardian name
+    - diagnosis_primary: Primary diagnosis name
+    - diagnosis_code_primary: Primary diagnosis ICD-10 code
+    - presenting_problems: Summary of symptoms/issues
+    - treatment_goals: Use the following measurable goals provided: {json.dumps(measurable_goals)}
+
+    2. Community Care Form fields:
+    - member_name: Patient's full name
+    - member_dob: Date of birth  
+    - member_id: Insurance ID or null
+    - caregiver_name: Parent/guardian name
+    - diagnosis: Array of diagnoses with name and code
+    - clinical_summary: Summary of symptoms and issues
+    - treatment_plan: {json.dumps(measurable_goals)}
+    - rationales: Reasons to Propose above measurable goals and recommended services - please be detailed and comprehensive
+
+    Respond with a JSON object with two keys: "ibhs" and "communityCare", each containing the mapped data for their respective forms.
+
+    Patient data:
+    {json.dumps(patient_data, indent=2)}
+    """
+
+    content = cached_chat_completion(
+        openai_client,
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": "You are a specialized form-filling assistant."},
+            {"role": "user", "content": mapping_prompt}
+        ],
+        temperature=0.1,
+        response_format={"type": "json_object"},
+        bypass_cache=bypass_cache,
+        stage="form_mapping"
+    )
+
+    # Parse the JSON response
+    form_data = json.loads(content)
+    logger.info("Form mapping completed")
+    logger.debug(f"Form data: {content}")
+    return form_data
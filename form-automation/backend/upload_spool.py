@@ -0,0 +1,133 @@
+# upload_spool.py
+import os
+import hashlib
+import logging
+import tempfile
+
+from flask import Request
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Chunk size used when an upload has to be copied rather than moved into place
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+class HashingSpoolFile:
+    """
+    Temporary file that receives an uploaded file straight from the request body and
+    hashes it as it is written.
+
+    The file is created in the upload folder, so saving the upload is a rename instead
+    of a second copy, and the SHA-256 digest is ready without reading the file back.
+    Unless persist() is called, the file is deleted when it is closed.
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): Directory the upload will be saved in
+        """
+        fd, self.name = tempfile.mkstemp(dir=directory, prefix='.spool-', suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self._size = 0
+        self._persisted = False
+
+    def write(self, data):
+        self._digest.update(data)
+        self._size += len(data)
+        return self._file.write(data)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    def __iter__(self):
+        return iter(self._file)
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    @property
+    def content_hash(self):
+        """SHA-256 hex digest of everything written so far"""
+        return self._digest.hexdigest()
+
+    @property
+    def size(self):
+        """Number of bytes written"""
+        return self._size
+
+    def persist(self, file_path):
+        """
+        Move the spooled upload to its final path.
+
+        Args:
+            file_path (str): Destination path (must be on the same filesystem)
+        """
+        self._file.close()
+        os.replace(self.name, file_path)
+        self._persisted = True
+
+    def close(self):
+        """Close the file, deleting it unless it was persisted"""
+        if not self._file.closed:
+            self._file.close()
+        if not self._persisted:
+            try:
+                os.unlink(self.name)
+            except OSError:
+                pass
+
+
+class SpoolingRequest(Request):
+    """
+    Request class whose uploaded files are spooled into HashingSpoolFile objects in
+    the app's UPLOAD_FOLDER instead of Werkzeug's default in-memory/temporary files.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        from flask import current_app
+        return HashingSpoolFile(current_app.config['UPLOAD_FOLDER'])
+
+
+def save_upload(file, file_path):
+    """
+    Save an uploaded file and hash its content in a single pass.
+
+    Files spooled by SpoolingRequest are simply moved into place; any other stream is
+    copied in chunks while hashing, so the upload is never held in memory as a whole.
+
+    Args:
+        file (FileStorage): Uploaded file
+        file_path (str): Destination path
+
+    Returns:
+        tuple: (size in bytes, SHA-256 hex digest)
+    """
+    stream = file.stream
+    if isinstance(stream, HashingSpoolFile):
+        stream.persist(file_path)
+        return stream.size, stream.content_hash
+
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, 'wb') as f:
+        for chunk in iter(lambda: stream.read(SPOOL_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
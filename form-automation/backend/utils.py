@@ -140,6 +140,128 @@ def validate_form_data(form_data, form_type):
     
     return len(errors) == 0, errors
 
+# Lists whose items are de-duplicated rather than concatenated when records are merged
+_DEDUP_LISTS = {'diagnoses', 'symptoms', 'goals'}
+
+# ICD-10 code inside free text, e.g. "ADHD (F90.0)"
+_ICD_CODE_RE = re.compile(r"\b([A-TV-Z]\d{2}(?:\.\w{1,4})?)\b")
+
+
+def _is_empty(value):
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    return isinstance(value, (list, dict)) and not value
+
+
+def _normalize_text(value):
+    return re.sub(r"\s+", " ", str(value)).strip().lower()
+
+
+def _normalize_icd_code(code):
+    return re.sub(r"[\s.]", "", str(code)).upper()
+
+
+def _list_item_key(list_name, item):
+    """
+    Identity of a list item for de-duplication. Diagnoses are identified by their
+    normalized ICD code when they have one, everything else by normalized content.
+    """
+    if list_name == 'diagnoses':
+        if isinstance(item, dict):
+            code = item.get('code') or item.get('icd_code')
+            if not _is_empty(code):
+                return f"code:{_normalize_icd_code(code)}"
+            return f"name:{_normalize_text(item.get('name') or '')}"
+        if isinstance(item, str):
+            match = _ICD_CODE_RE.search(item)
+            if match:
+                return f"code:{_normalize_icd_code(match.group(1))}"
+
+    if isinstance(item, str):
+        return f"text:{_normalize_text(item)}"
+    return f"json:{json.dumps(item, sort_keys=True, default=str)}"
+
+
+def _pick_value(values):
+    """
+    Choose one of several conflicting values independently of their order: the most
+    frequent one, then the most detailed (longest), then the lexicographically smallest.
+    """
+    counts = {}
+    for value in values:
+        if isinstance(value, str):
+            value = value.strip()
+        key = json.dumps(value, sort_keys=True, default=str)
+        count, _ = counts.get(key, (0, value))
+        counts[key] = (count + 1, value)
+
+    best_key = min(counts, key=lambda key: (-counts[key][0], -len(key), key))
+    return counts[best_key][1]
+
+
+def _merge_lists(list_name, lists):
+    """
+    Union several lists, merging items that share an identity. Items keep the order in
+    which they were first seen, so the primary diagnosis of the first record stays first.
+    """
+    # dicts keep insertion order: first-seen order across the lists, in record order
+    groups = {}
+    for items in lists:
+        for item in items:
+            groups.setdefault(_list_item_key(list_name, item), []).append(item)
+
+    merged = []
+    for items in groups.values():
+        if all(isinstance(item, dict) for item in items):
+            merged.append(merge_patient_records(items))
+        else:
+            merged.append(_pick_value(items))
+    return merged
+
+
+def merge_patient_records(records):
+    """
+    Merge patient data extracted from several documents of the same patient.
+
+    Non-empty values win over empty ones, nested dictionaries are merged recursively,
+    lists are de-duplicated (diagnoses by ICD code, other items by normalized content)
+    keeping first-seen order, and conflicting values are resolved by _pick_value, which
+    does not depend on record order. List order follows the order of the records, so
+    callers pass them in document order.
+
+    Args:
+        records (list): Patient data dictionaries, in document order
+
+    Returns:
+        dict: Merged patient data
+    """
+    records = [record for record in records if record]
+    keys = set()
+    for record in records:
+        keys.update(record)
+
+    merged = {}
+    for key in sorted(keys):
+        values = [record[key] for record in records if key in record]
+        present = [value for value in values if not _is_empty(value)]
+
+        if not present:
+            merged[key] = _pick_value(values)
+        elif all(isinstance(value, dict) for value in present):
+            merged[key] = merge_patient_records(present)
+        elif all(isinstance(value, list) for value in present):
+            if key.lower() in _DEDUP_LISTS:
+                merged[key] = _merge_lists(key.lower(), present)
+            else:
+                merged[key] = _merge_lists(None, present)
+        else:
+            merged[key] = _pick_value(present)
+
+    return merged
+
+
 def merge_patient_data(existing_data, new_data):
     """
     Merge new patient data with existing data, prioritizing non-empty values
@@ -149,33 +271,6 @@ def merge_patient_data(existing_data, new_data):
         new_data (dict): New patient data to merge
         
     Returns:
-        dict: Merged patient data
+        dict: Merged patient data (see merge_patient_records)
     """
-    merged = existing_data.copy()
-    
-    for key, value in new_data.items():
-        # If the key doesn't exist in the existing data, or the existing value is empty
-        # but the new value is not, use the new value
-        if key not in merged or (not merged[key] and value):
-            merged[key] = value
-        
-        # Special handling for nested dictionaries
-        elif isinstance(value, dict) and isinstance(merged[key], dict):
-            merged[key] = merge_patient_data(merged[key], value)
-        
-        # Special handling for lists - append new items
-        elif isinstance(value, list) and isinstance(merged[key], list):
-            # For diagnoses, symptoms, etc. - check for duplicates
-            if key in ['diagnoses', 'symptoms', 'goals']:
-                # Convert existing items to set of strings for comparison
-                existing_items = set(str(item) for item in merged[key])
-                
-                # Add new items that don't exist in the set
-                for item in value:
-                    if str(item) not in existing_items:
-                        merged[key].append(item)
-            else:
-                # For other lists, just append
-                merged[key].extend(value)
-    
-    return merged
\ No newline at end of file
+    return merge_patient_records([existing_data, new_data])
@@ -123,8 +123,13 @@ const FormUpload = () => {
       setError(null);
       startProcessing();
       
-      // Update upload progress and status
-      const onProgress = (progress) => {
+      // Update upload progress and status; progress never moves backwards
+      let currentProgress = 0;
+      const onProgress = (progress, stageText) => {
+        if (progress < currentProgress) {
+          return;
+        }
+        currentProgress = progress;
         let statusText = 'Uploading file...';
         
         // Display different status messages based on progress
@@ -138,19 +143,48 @@ const FormUpload = () => {
           statusText = 'Finalizing processing...';
         }
         
-        updateProcessingProgress(progress, statusText);
+        updateProcessingProgress(progress, stageText || statusText);
         setUploadProgress(progress);
       };
       
       // Start with upload progress at 0
       onProgress(0);
       
+      // Server-side stages, reported as they happen
+      let extractedText;
+      const onStage = (event) => {
+        switch (event.stage) {
+          case 'ocr_page':
+            onProgress(60 + Math.round((event.pagesDone / Math.max(event.totalPages, 1)) * 10),
+              `Processing OCR with Mistral... page ${event.pagesDone}/${event.totalPages}`);
+            break;
+          case 'ocr_done':
+            // Show the OCR text right away instead of after the last LLM call
+            extractedText = event.extractedText;
+            setPatientData({ extractedText });
+            onProgress(70, 'Analyzing data with ChatGPT...');
+            break;
+          case 'extraction_done':
+            setPatientData({ ...event.patientData, extractedText });
+            onProgress(80, 'Generating measurable goals...');
+            break;
+          case 'goals_done':
+            onProgress(85, 'Mapping data to forms...');
+            break;
+          case 'mapping_done':
+            onProgress(95, 'Finalizing processing...');
+            break;
+          default:
+            break;
+        }
+      };
+      
       // Upload file and process with OCR and LLM
       const response = await apiService.uploadFiles(uploadedFiles, (progress) => {
         // Map the actual upload progress (0-100) to 0-60% of our displayed progress
         // since the upload is just the first part of the process
         onProgress(Math.min(Math.round(progress * 0.6), 60));
-      });
+      }, onStage);
 
       // Add detailed logging to help diagnose issues
       console.log("API Response:", response);
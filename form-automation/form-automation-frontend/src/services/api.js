@@ -3,6 +3,21 @@ import axios from 'axios';
 
 const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:5000/api';
 
+// Progress stages reported by the backend while an upload job runs
+const UPLOAD_STAGES = [
+  'saved',
+  'validated',
+  'ocr_page',
+  'ocr_done',
+  'clinical_extraction_done',
+  'extraction_done',
+  'goals_done',
+  'mapping_done'
+];
+
+// Give up following a job that has not finished after this long
+const JOB_WATCH_TIMEOUT_MS = 10 * 60 * 1000;
+
 // Create axios instance with defaults
 const api = axios.create({
   baseURL: API_BASE_URL,
@@ -16,9 +31,10 @@ const apiService = {
    * Upload and process files
    * @param {Array} files - Array of file objects
    * @param {Function} onProgress - Progress callback
+   * @param {Function} onStage - Called with each server-side processing event
    * @returns {Promise} - Resolved with extracted data
    */
-  uploadFiles: async (files, onProgress) => {
+  uploadFiles: async (files, onProgress, onStage) => {
     try {
       console.log(`Uploading file to ${API_BASE_URL}/upload`);
       
@@ -45,21 +61,26 @@ const apiService = {
         }
       });
       
-      if (response.data.status === 'success') {
+      // Processing runs as a background job on the server; follow its events until it finishes
+      const result = response.data.jobId
+        ? await apiService.watchJob(response.data.jobId, onStage)
+        : response.data;
+      
+      if (result.status === 'success') {
         // Extract patientData and formData from the response
         return {
           patientData: {
-            ...response.data.patientData,
-            extractedText: response.data.extractedText // Include extracted OCR text
+            ...result.patientData,
+            extractedText: result.extractedText // Include extracted OCR text
           },
-          formData: response.data.formData || {
+          formData: result.formData || {
             ibhs: {},
             communityCare: {},
           },
-          measurableGoals: response.data.measurableGoals || response.data.measurableGoals_results || []
+          measurableGoals: result.measurableGoals || result.measurableGoals_results || []
         };
       } else {
-        throw new Error(response.data.error || 'Processing failed');
+        throw new Error(result.error || 'Processing failed');
       }
     } catch (error) {
       console.error('File upload error:', error);
@@ -72,6 +93,39 @@ const apiService = {
     }
   },
   
+  /**
+   * Follow a background upload job by polling its progress events. Each poll returns
+   * at once, so no server worker is held open while the job runs.
+   * @param {String} jobId - Job ID returned by the upload endpoint
+   * @param {Function} onStage - Called with each processing event
+   * @param {Number} intervalMs - Delay between polls
+   * @param {Number} timeoutMs - Time after which the job is given up on
+   * @returns {Promise} - Resolved with the job result
+   */
+  watchJob: async (jobId, onStage, intervalMs = 1000, timeoutMs = JOB_WATCH_TIMEOUT_MS) => {
+    const deadline = Date.now() + timeoutMs;
+    let lastSeq = 0;
+    while (Date.now() < deadline) {
+      const response = await api.get(`/jobs/${jobId}/events`, { params: { after: lastSeq } });
+      
+      for (const event of response.data.events) {
+        lastSeq = event.seq;
+        if (event.stage === 'succeeded') {
+          return event.result;
+        }
+        if (event.stage === 'failed') {
+          throw new Error(event.error || 'Processing failed');
+        }
+        if (onStage && UPLOAD_STAGES.includes(event.stage)) {
+          onStage(event);
+        }
+      }
+      
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+    throw new Error('Processing timed out');
+  },
+  
   /**
    * Generate PDF forms
    * @param {Object} formData - Form data for both forms
@@ -103,6 +157,36 @@ const apiService = {
     }
   },
   
+  /**
+   * Generate forms and receive the file directly in the response
+   * (a PDF for a single form, a zip for several) without a second download request
+   * @param {Object} formData - Form data for the forms
+   * @param {Array} forms - Form types to generate (defaults to all)
+   * @returns {Promise} - Resolved with { blob, filename }
+   */
+  generateFormsFile: async (formData, forms) => {
+    try {
+      const response = await api.post('/generate-forms', {
+        formData: formData,
+        delivery: 'stream',
+        forms: forms
+      }, {
+        responseType: 'blob'
+      });
+      
+      const disposition = response.headers['content-disposition'] || '';
+      const match = disposition.match(/filename="?([^";]+)"?/);
+      
+      return {
+        blob: response.data,
+        filename: match ? match[1] : 'forms'
+      };
+    } catch (error) {
+      console.error('Form generation error:', error);
+      throw new Error('Failed to generate forms. Please try again.');
+    }
+  },
+  
   /**
    * Download a form
    * @param {String} url - Form download URL